@@ -0,0 +1,77 @@
+"""
+ASGI entry point for the movie recommender API
+The Flask app stays a WSGI app (its views are synchronous); this adapter runs each
+request on its own thread from a pool, so one process works as a threaded WSGI
+server behind an ASGI server, handling up to ASGI_THREADS requests at once;
+run with:  uvicorn asgi:asgi_app --port 5000
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from asgiref.sync import AsyncToSync, sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from app import app
+
+# Requests handled concurrently by one process (each holds a thread while it runs)
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+# Request bodies larger than this are spooled to a temporary file
+MAX_MEMORY_BODY = 65536
+
+class ThreadPoolWsgiToAsgi:
+    """
+    WSGI-to-ASGI adapter that runs requests concurrently on a thread pool
+    asgiref's own WsgiToAsgi runs the WSGI app thread-sensitively, which puts every
+    request on one shared thread and serializes them; this adapter reuses its public
+    environ and start_response handling and runs the app through sync_to_async on
+    its own executor instead
+    """
+
+    def __init__(self, wsgi_application, threads=ASGI_THREADS):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-request')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError("WSGI adapter received a non-HTTP scope")
+        with SpooledTemporaryFile(max_size=MAX_MEMORY_BODY) as body:
+            while True:
+                message = await receive()
+                if message['type'] != 'http.request':
+                    raise ValueError("WSGI adapter received a non-HTTP-request message")
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            serve = sync_to_async(self.serve, thread_sensitive=False, executor=self.executor)
+            await serve(scope, body, AsyncToSync(send))
+
+    def serve(self, scope, body, send):
+        """Run the WSGI app for one request on a pool thread, sending the response as it is produced"""
+        instance = WsgiToAsgiInstance(self.wsgi_application)
+        instance.scope = scope
+        environ = instance.build_environ(scope, body)
+
+        started = False
+        bytes_sent = 0
+        output = self.wsgi_application(environ, instance.start_response)
+        try:
+            for chunk in output:
+                if not started:
+                    started = True
+                    send(instance.response_start)
+                # Never send more than the declared Content-Length
+                if instance.response_content_length is not None:
+                    chunk = chunk[:instance.response_content_length - bytes_sent]
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                bytes_sent += len(chunk)
+                if bytes_sent == instance.response_content_length:
+                    break
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+        if not started:
+            send(instance.response_start)
+        send({'type': 'http.response.body'})
+
+asgi_app = ThreadPoolWsgiToAsgi(app)
@@ -0,0 +1,184 @@
+"""
+Offline batch precomputation of user recommendations
+Scores every user with recent ratings against the model's neighbor lists (or
+its LSA embeddings) in blocks of users, one matrix multiply per block, and stores
+each user's top movies and their scores in the user_recommendations table; the
+API re-ranks them for diversity exactly as it does its online candidate pools
+
+Rows are matched to the serving model by its content version, so the model built
+here and the one built by each web process agree as long as the catalog does
+"""
+import os
+import sys
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from models import Rating
+import db_writes
+import model_builder
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Users who rated anything within this many days are precomputed
+ACTIVE_DAYS = int(os.environ.get('RECOMMENDER_BATCH_ACTIVE_DAYS', 30))
+
+# Recommendations stored per user
+BATCH_TOP_N = int(os.environ.get('RECOMMENDER_BATCH_TOP_N', 50))
+
+# Users scored per matrix multiply
+USER_BLOCK_SIZE = 1000
+
+def knn_matrix(neighbor_indices, neighbor_scores, score_scale=None):
+    """Sparse movie x movie matrix holding each movie's neighbor similarities"""
+    n_movies, top_k = neighbor_indices.shape
+    scores = model_builder.dequantize_scores(neighbor_scores, score_scale).ravel()
+    indptr = np.arange(0, n_movies * top_k + 1, top_k)
+    return sparse.csr_matrix((scores, np.asarray(neighbor_indices).ravel(), indptr),
+                             shape=(n_movies, n_movies))
+
+def active_user_ids(session, since):
+    """Get the IDs of users with ratings created or updated since the given time"""
+    return list(session.execute(
+        select(Rating.user_id).where(Rating.updated_at >= since).distinct().order_by(Rating.user_id)
+    ).scalars())
+
+def _user_block_matrices(session, user_ids, movie_indices):
+    """
+    Build liked (rating >= 4.0) and rated indicator matrices for a block of users
+    Rows follow user_ids, columns are model indices
+    """
+    rows = session.execute(
+        select(Rating.user_id, Rating.movie_id, Rating.rating).where(Rating.user_id.in_(user_ids))
+    ).all()
+
+    positions = {user_id: i for i, user_id in enumerate(user_ids)}
+    rated = [(positions[user_id], movie_indices[movie_id], rating) for user_id, movie_id, rating in rows
+             if movie_id in movie_indices]
+    if not rated:
+        empty = sparse.csr_matrix((len(user_ids), len(movie_indices)), dtype=np.float32)
+        return empty, empty
+
+    user_rows, columns, values = (np.array(values) for values in zip(*rated))
+    shape = (len(user_ids), len(movie_indices))
+    rated_matrix = sparse.csr_matrix((np.ones(len(user_rows), dtype=np.float32), (user_rows, columns)), shape=shape)
+    liked = values >= 4.0
+    liked_matrix = sparse.csr_matrix(
+        (np.ones(liked.sum(), dtype=np.float32), (user_rows[liked], columns[liked])), shape=shape
+    )
+    return liked_matrix, rated_matrix
+
+def score_user_block(liked, rated, knn, top_n=BATCH_TOP_N):
+    """
+    Score a block of users against all movies with one sparse multiply
+    A movie's score is its summed similarity to the user's liked movies; rated movies are excluded
+    Returns one (model indices, scores) pair per user, best first
+    """
+    scores = (liked @ knn).tocsr()
+    # Zero out rated movies, then drop the explicit zeros
+    scores = (scores - scores.multiply(rated)).tocsr()
+    scores.eliminate_zeros()
+
+    results = []
+    for row in range(scores.shape[0]):
+        start, stop = scores.indptr[row], scores.indptr[row + 1]
+        columns, values = scores.indices[start:stop], scores.data[start:stop]
+        if len(values) > top_n:
+            keep = np.argpartition(-values, top_n - 1)[:top_n]
+            columns, values = columns[keep], values[keep]
+        order = np.argsort(-values, kind='stable')
+        results.append((columns[order], values[order]))
+    return results
+
+def score_user_block_embeddings(liked, rated, embeddings, top_n=BATCH_TOP_N):
+    """
+    Score a block of users against all movies by similarity to the sum of their liked
+    movies' embeddings, as the online candidate pool does; rated movies are excluded
+    Returns one (model indices, scores) pair per user, best first
+    """
+    scores = np.asarray(liked @ embeddings) @ embeddings.T
+    rated = rated.tocoo()
+    scores[rated.row, rated.col] = -np.inf
+
+    results = []
+    for row, user_scores in enumerate(scores):
+        n_scored = int(np.count_nonzero(user_scores > -np.inf))
+        if liked.indptr[row] == liked.indptr[row + 1] or not n_scored:
+            results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            continue
+        keep = min(top_n, n_scored)
+        top = np.argpartition(-user_scores, keep - 1)[:keep]
+        top = top[np.argsort(-user_scores[top], kind='stable')]
+        results.append((top, user_scores[top]))
+    return results
+
+def precompute_recommendations(session, recommender, active_days=ACTIVE_DAYS, top_n=BATCH_TOP_N,
+                               block_size=USER_BLOCK_SIZE):
+    """
+    Precompute and store top_n recommendations for every recently active user
+    recommender is an initialized MovieRecommender whose embeddings, or else neighbor lists, are used
+    Returns the number of users written
+    """
+    started = time.time()
+    embeddings = recommender.embeddings
+    if embeddings is None:
+        knn = knn_matrix(recommender.neighbor_indices, recommender.neighbor_scores, recommender.score_scale)
+    user_ids = active_user_ids(session, datetime.utcnow() - timedelta(days=active_days))
+    written = 0
+
+    for start in range(0, len(user_ids), block_size):
+        block = user_ids[start:start + block_size]
+        liked, rated = _user_block_matrices(session, block, recommender.movie_indices)
+        computed_at = datetime.utcnow()
+
+        if embeddings is None:
+            scored = score_user_block(liked, rated, knn, top_n)
+        else:
+            scored = score_user_block_embeddings(liked, rated, embeddings, top_n)
+
+        rows = []
+        for user_id, (indices, scores) in zip(block, scored):
+            if len(indices) == 0:
+                continue
+            rows.append({
+                'user_id': user_id,
+                'movie_ids': ','.join(str(int(recommender.movie_ids[i])) for i in indices),
+                'scores': ','.join(f"{score:.7g}" for score in scores),
+                'model_version': recommender.model_version,
+                'computed_at': computed_at
+            })
+
+        db_writes.upsert_user_recommendations(session, rows)
+        session.commit()
+        written += len(rows)
+
+    logger.info(f"Precomputed recommendations for {written} of {len(user_ids)} active users "
+                f"in {time.time() - started:.2f}s")
+    return written
+
+if __name__ == "__main__":
+    import argparse
+    from app import app
+    from models import db, Movie
+    from recommender import MovieRecommender
+
+    parser = argparse.ArgumentParser(description="Precompute recommendations for recently active users")
+    parser.add_argument('--active-days', type=int, default=ACTIVE_DAYS)
+    parser.add_argument('--top-n', type=int, default=BATCH_TOP_N)
+    parser.add_argument('--block-size', type=int, default=USER_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    # Always score in-process, even when the web app uses the recommender service
+    movie_recommender = MovieRecommender(db, Movie)
+    with app.app_context():
+        if not movie_recommender.initialize_recommendation_model() or movie_recommender.neighbor_indices is None:
+            print("No recommendation model available")
+            sys.exit(1)
+
+        written = precompute_recommendations(db.session, movie_recommender, args.active_days,
+                                             args.top_n, args.block_size)
+        print(f"Stored recommendations for {written} users")
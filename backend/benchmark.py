@@ -0,0 +1,611 @@
+"""
+Benchmarks for the recommendation model
+Builds model variants from the current database and compares build cost and
+neighbor quality against the default TF-IDF model
+
+Usage:
+    python benchmark.py feature-modes [--k 10]
+    python benchmark.py precision [--k 10]
+    python benchmark.py lsa [--dims 64 128 256] [--k 10]
+    python benchmark.py candidates [--k 10]
+    python benchmark.py filters [--users 200]
+    python benchmark.py typeahead [--queries 2000]
+    python benchmark.py memory [--workers 4] [--requests 50]
+    python benchmark.py importtime [--budget-ms 1000]
+    python benchmark.py empty-fields
+    python benchmark.py add-movies [--held-out 0.1] [--k 10]
+    python benchmark.py asgi [--requests 4] [--delay 0.5]
+"""
+import os
+import sys
+import time
+import bisect
+import asyncio
+import threading
+import subprocess
+import argparse
+import tracemalloc
+from array import array
+from collections import namedtuple
+import numpy as np
+from app import app, get_movie_recommender, get_typeahead, preload_shared_state
+from models import db, Movie
+import model_builder
+import typeahead
+from inverted_index import InvertedIndex
+from rating_store import UserRatings
+
+# Milliseconds `import app` may take before the importtime check fails
+IMPORT_BUDGET_MS = 1000
+
+# Heavy modules that importing the app must leave for first use
+LAZY_MODULES = ('numpy', 'scipy', 'sklearn', 'pandas', 'requests', 'recommender', 'model_builder', 'omdb_service',
+                'catalog', 'typeahead')
+
+def neighbor_overlap(reference, candidate, k=10):
+    """
+    Mean fraction of each movie's top-k reference neighbors that the candidate model also returns
+    Both models must index the same movies in the same order
+    """
+    if not np.array_equal(reference['movie_ids'], candidate['movie_ids']):
+        raise ValueError("Models were built from different catalogs")
+
+    reference_neighbors = reference['neighbor_indices'][:, :k]
+    candidate_neighbors = candidate['neighbor_indices'][:, :k]
+    if reference_neighbors.shape[1] == 0:
+        return 1.0
+
+    overlaps = [
+        len(np.intersect1d(ref_row, cand_row, assume_unique=True)) / len(ref_row)
+        for ref_row, cand_row in zip(reference_neighbors, candidate_neighbors)
+    ]
+    return float(np.mean(overlaps))
+
+def timed_build(**kwargs):
+    """
+    Build a model from the database, returning (model, seconds, peak traced MB)
+    The time comes from an untraced build, since tracing slows Python-heavy code far more
+    than vectorized code; the peak comes from a second, traced build
+    """
+    started = time.perf_counter()
+    model = model_builder.build_model(model_builder.stream_feature_rows(db.session, Movie), **kwargs)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    model_builder.build_model(model_builder.stream_feature_rows(db.session, Movie), **kwargs)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return model, seconds, peak_mb
+
+def print_table(headers, rows):
+    """Print rows as an aligned text table"""
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+def compare_feature_modes(k):
+    """Compare the hashing feature mode against the vocabulary-based TF-IDF model"""
+    reference, reference_seconds, reference_peak = timed_build(mode='tfidf')
+    if reference is None:
+        print("No movies in database to benchmark")
+        return 1
+
+    hashed, hashed_seconds, hashed_peak = timed_build(mode='hashing')
+
+    rows = []
+    for name, model, seconds, peak in (('tfidf', reference, reference_seconds, reference_peak),
+                                       ('hashing', hashed, hashed_seconds, hashed_peak)):
+        rows.append([
+            name,
+            f"{seconds:.2f}",
+            f"{peak:.1f}",
+            model['item_vectors'].shape[1],
+            model['item_vectors'].nnz,
+            f"{neighbor_overlap(reference, model, k):.3f}"
+        ])
+
+    print(f"{len(reference['movie_ids'])} movies")
+    print_table(['mode', 'build_s', 'peak_mb', 'features', 'nnz', f'overlap@{k}'], rows)
+    return 0
+
+def compare_score_precisions(k):
+    """
+    Check float32 item vectors and quantized neighbor scores against full float64 precision
+    Score errors are measured rank by rank over each movie's neighbor list
+    """
+    model, _, _ = timed_build(score_precision='float32')
+    if model is None:
+        print("No movies in database to benchmark")
+        return 1
+
+    top_k = model['neighbor_indices'].shape[1]
+    full_vectors = model_builder.apply_field_weights(
+        model['field_vectors'], model['field_slices'], model['field_weights'], dtype=np.float64
+    )
+    full_indices, full_scores = model_builder.compute_neighbors(full_vectors, top_k)
+    reference = {'movie_ids': model['movie_ids'], 'neighbor_indices': full_indices}
+
+    rows = [['float64', f"{full_vectors.data.nbytes / 1e6:.2f}", f"{full_scores.nbytes / 1e6:.2f}",
+             '0', '0', '1.000']]
+    for precision in model_builder.SCORE_PRECISIONS:
+        stored, scale = model_builder.quantize_scores(model['neighbor_scores'], precision)
+        errors = np.abs(model_builder.dequantize_scores(stored, scale) - full_scores)
+        rows.append([
+            precision,
+            f"{model['item_vectors'].data.nbytes / 1e6:.2f}",
+            f"{stored.nbytes / 1e6:.2f}",
+            f"{errors.max():.2e}" if errors.size else '0',
+            f"{errors.mean():.2e}" if errors.size else '0',
+            f"{neighbor_overlap(reference, model, k):.3f}"
+        ])
+
+    print(f"{len(model['movie_ids'])} movies, {top_k} neighbors each")
+    print_table(['scores', 'vectors_mb', 'scores_mb', 'max_err', 'mean_err', f'overlap@{k}'], rows)
+    return 0
+
+def matrix_mb(matrix):
+    """Memory held by a dense or sparse matrix's arrays, in MB"""
+    if hasattr(matrix, 'indptr'):
+        return (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1e6
+    return matrix.nbytes / 1e6
+
+def similarity_latency(matrix, n_queries=200):
+    """Mean milliseconds to score one movie against the whole catalog"""
+    rows = np.random.default_rng(0).integers(0, matrix.shape[0], n_queries)
+    started = time.perf_counter()
+    for row in rows:
+        matrix[row:row + 1] @ matrix.T
+    return (time.perf_counter() - started) / n_queries * 1000
+
+def compare_embedding_dims(dims, k):
+    """Compare dense LSA embeddings of several sizes against the sparse TF-IDF vectors"""
+    reference, reference_seconds, reference_peak = timed_build(embedding_dim=0)
+    if reference is None:
+        print("No movies in database to benchmark")
+        return 1
+
+    rows = [[
+        'sparse',
+        f"{reference_seconds:.2f}",
+        f"{reference_peak:.1f}",
+        f"{matrix_mb(reference['item_vectors']):.2f}",
+        f"{similarity_latency(reference['item_vectors']):.3f}",
+        '1.000'
+    ]]
+    for dim in dims:
+        model, seconds, peak = timed_build(embedding_dim=dim)
+        embeddings = model.get('embeddings', model['item_vectors'])
+        rows.append([
+            f"lsa-{embeddings.shape[1]}",
+            f"{seconds:.2f}",
+            f"{peak:.1f}",
+            f"{matrix_mb(embeddings):.2f}",
+            f"{similarity_latency(embeddings):.3f}",
+            f"{neighbor_overlap(reference, model, k):.3f}"
+        ])
+
+    print(f"{len(reference['movie_ids'])} movies")
+    print_table(['vectors', 'build_s', 'peak_mb', 'vectors_mb', 'query_ms', f'overlap@{k}'], rows)
+    return 0
+
+def compare_neighbor_candidates(k):
+    """Compare neighbors scored against inverted-index candidates with scoring the whole catalog"""
+    reference, reference_seconds, reference_peak = timed_build(candidates='all')
+    if reference is None:
+        print("No movies in database to benchmark")
+        return 1
+
+    model, seconds, peak = timed_build(candidates='index')
+    index = InvertedIndex(model['metadata'])
+    sample = np.random.default_rng(0).integers(0, index.n_movies, min(index.n_movies, 500))
+    candidate_counts = [len(index.candidates(row, model_builder.MAX_CANDIDATES)) for row in sample]
+
+    rows = [
+        ['all', f"{reference_seconds:.2f}", f"{reference_peak:.1f}", index.n_movies - 1, '1.000'],
+        ['index', f"{seconds:.2f}", f"{peak:.1f}", f"{np.mean(candidate_counts):.0f}",
+         f"{neighbor_overlap(reference, model, k):.3f}"]
+    ]
+    print(f"{index.n_movies} movies, at most {model_builder.MAX_CANDIDATES} candidates per movie")
+    print_table(['candidates', 'build_s', 'peak_mb', 'scored_per_movie', f'overlap@{k}'], rows)
+    return 0
+
+def compare_filtered_pools(n_users):
+    """Compare the cost of building users' candidate pools with and without filters"""
+    movie_recommender = get_movie_recommender()
+    if not movie_recommender.initialize_recommendation_model() or movie_recommender.movie_ids is None:
+        print("No movies in database to benchmark")
+        return 1
+
+    snapshot = movie_recommender.catalog.get()
+    genre_sizes = snapshot.genre_bitmaps.sum(axis=1)
+    filter_sets = [('none', None)]
+    if len(genre_sizes):
+        filter_sets.append(('genre', {'genre': snapshot.genre_names[int(np.argmax(genre_sizes))].lower()}))
+    known_years = snapshot.years[snapshot.years > 0]
+    if len(known_years):
+        decade = int(np.median(known_years)) // 10 * 10
+        filter_sets.append(('decade', {'year_from': decade, 'year_to': decade + 9}))
+    filter_sets.append(('min_votes', {'min_votes': int(np.median(snapshot.vote_counts))}))
+    filter_sets.append(('combined', dict(kv for _, f in filter_sets[1:] for kv in f.items())))
+
+    # Synthetic users who liked 20 random movies each
+    rng = np.random.default_rng(0)
+    users = []
+    for user in range(n_users):
+        liked = np.sort(rng.choice(movie_recommender.movie_ids, min(20, len(movie_recommender.movie_ids)), replace=False))
+        users.append(UserRatings(array('l', liked.tolist()), array('f', [5.0] * len(liked)), -1 - user, time.time()))
+
+    rows = []
+    for name, filters in filter_sets:
+        # The first call builds the filter's bitmap; pools themselves are not cached between users
+        started = time.perf_counter()
+        movie_recommender._filter_mask(filters)
+        mask_ms = (time.perf_counter() - started) * 1000
+
+        pool_sizes = []
+        started = time.perf_counter()
+        for user, ratings in enumerate(users):
+            candidates, _ = movie_recommender._candidate_pool(-1 - user, ratings, filters)
+            pool_sizes.append(len(candidates))
+        pool_ms = (time.perf_counter() - started) / len(users) * 1000
+
+        matching = int(snapshot.mask(filters).sum())
+        rows.append([name, matching, f"{mask_ms:.3f}", f"{pool_ms:.3f}", f"{np.mean(pool_sizes):.0f}"])
+
+    print(f"{len(movie_recommender.movie_ids)} movies, {n_users} users")
+    print_table(['filter', 'matching', 'bitmap_ms', 'pool_ms', 'pool_size'], rows)
+    return 0
+
+def matching_keys(index, prefix):
+    """Number of typeahead index keys starting with a normalized prefix"""
+    return bisect.bisect_left(index.keys, prefix + typeahead.PREFIX_END) - bisect.bisect_left(index.keys, prefix)
+
+def measure_typeahead(n_queries, limit=8):
+    """Time typeahead lookups for 1 to 5 character prefixes of catalog titles and names"""
+    started = time.perf_counter()
+    index = get_typeahead().get()
+    build_seconds = time.perf_counter() - started
+    if not len(index):
+        print("No movies in database to benchmark")
+        return 1
+
+    rng = np.random.default_rng(0)
+    sources = [index.suggestions[i]['text'] for i in rng.integers(0, len(index), n_queries)]
+
+    rows = []
+    for length in range(1, 6):
+        queries = [typeahead.normalize(text)[:length] for text in sources]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        matched = np.mean([matching_keys(index, query) for query in queries])
+        rows.append([length, f"{matched:.0f}", f"{np.percentile(timings, 50):.3f}",
+                     f"{np.percentile(timings, 99):.3f}", f"{max(timings):.3f}"])
+
+    print(f"{len(index)} suggestions, {len(index.keys)} keys, built in {build_seconds:.2f}s")
+    print_table(['prefix_len', 'keys_matched', 'p50_ms', 'p99_ms', 'max_ms'], rows)
+    return 0
+
+def process_memory_mb(pid):
+    """Rss, Pss and private (unshared) memory of a process in MB, from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+def fork_workers(n_workers, n_requests, build_in_worker):
+    """
+    Fork workers that each serve n_requests similar-movie lookups, then measure them and
+    this (master) process while all are alive together, so Pss splits shared pages between them
+    Returns (list of (rss, pss, private) MB per worker, master Pss MB)
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+    workers = []
+    for _ in range(n_workers):
+        ready_read, ready_write = os.pipe()
+        done_read, done_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(ready_read)
+                os.close(done_write)
+                movie_recommender = get_movie_recommender()
+                with app.app_context():
+                    if build_in_worker:
+                        movie_recommender.initialize_recommendation_model(force=True)
+                    movie_ids = movie_recommender.movie_ids
+                    for movie_id in movie_ids[np.random.default_rng(os.getpid()).integers(0, len(movie_ids), n_requests)]:
+                        movie_recommender.get_recommendations(int(movie_id))
+                os.write(ready_write, b'1')
+                os.read(done_read, 1)
+            finally:
+                os._exit(0)
+        os.close(ready_write)
+        os.close(done_read)
+        workers.append((pid, ready_read, done_write))
+
+    for _, ready_read, _ in workers:
+        os.read(ready_read, 1)
+    usage = [process_memory_mb(pid) for pid, _, _ in workers]
+    master_pss = process_memory_mb(os.getpid())[1]
+
+    for pid, ready_read, done_write in workers:
+        os.write(done_write, b'1')
+        os.close(ready_read)
+        os.close(done_write)
+        os.waitpid(pid, 0)
+    return usage, master_pss
+
+def compare_preload_memory(n_workers, n_requests):
+    """
+    Compare per-worker memory with the model built in each worker against one preloaded before fork
+    Each total adds the master's Pss, sampled while its workers are alive, to theirs
+    """
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("Memory benchmark needs Linux /proc/<pid>/smaps_rollup")
+        return 1
+
+    with app.app_context():
+        if not db.session.query(Movie.id).first():
+            print("No movies in database to benchmark")
+            return 1
+        db.session.remove()
+
+    # Lazy first, while this process holds no model of its own
+    lazy = fork_workers(n_workers, n_requests, build_in_worker=True)
+    preload_shared_state()
+    preloaded = fork_workers(n_workers, n_requests, build_in_worker=False)
+
+    rows = []
+    for name, (usage, master_pss) in (('per-worker', lazy), ('preload', preloaded)):
+        rss, pss, private = np.mean(usage, axis=0)
+        rows.append([
+            name,
+            f"{rss:.1f}",
+            f"{pss:.1f}",
+            f"{private:.1f}",
+            f"{sum(worker[1] for worker in usage) + master_pss:.1f}"
+        ])
+
+    print(f"{len(get_movie_recommender().movie_ids)} movies, {n_workers} workers, {n_requests} requests each")
+    print_table(['model', 'rss_mb', 'pss_mb', 'private_mb', 'total_pss_mb'], rows)
+    return 0
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output into (module, nesting depth, cumulative ms) tuples
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(cumulative) / 1000))
+    return modules
+
+def check_import_time(budget_ms, top=10):
+    """
+    Import the app in a fresh interpreter and check it against the import-time budget
+    Fails if the import is over budget or eagerly imports any of LAZY_MODULES
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        return 1
+
+    modules = parse_importtime(result.stderr)
+    total_ms = next(ms for name, depth, ms in modules if name == 'app' and depth == 0)
+    direct = sorted(((name, ms) for name, depth, ms in modules if depth == 1), key=lambda item: -item[1])
+    eager = sorted({name for name, _, _ in modules if name.split('.')[0] in LAZY_MODULES})
+
+    print_table(['module', 'cumulative_ms'], [[name, f"{ms:.1f}"] for name, ms in direct[:top]])
+    print(f"import app: {total_ms:.1f}ms (budget {budget_ms}ms)")
+
+    failed = False
+    if total_ms > budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    return 1 if failed else 0
+
+def check_add_movies(held_out, k):
+    """
+    Check adding movies to a hashing model without a refit: re-vectorizing the model's own
+    movies must reproduce its item vectors, and every added movie must get neighbors
+    Also reports the added movies' neighbor overlap against rebuilding with them
+    """
+    rows = list(model_builder.stream_feature_rows(db.session, Movie))
+    n_base = int(len(rows) * (1 - held_out))
+    if n_base < 2 or n_base == len(rows):
+        print("Not enough movies in database to hold some out")
+        return 1
+
+    base = model_builder.build_model(iter(rows[:n_base]), mode='hashing')
+    _, item_vectors = model_builder.vectorize_rows(rows[:n_base], base)
+    vector_error = abs(item_vectors - base['item_vectors']).max()
+
+    started = time.perf_counter()
+    updated = model_builder.add_movies(base, rows[n_base:])
+    add_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rebuilt = model_builder.build_model(iter(rows), mode='hashing')
+    rebuild_seconds = time.perf_counter() - started
+
+    added = updated['neighbor_indices'][n_base:]
+    has_neighbors = bool(len(added)) and (added != np.arange(n_base, len(rows))[:, None]).all()
+    overlap = neighbor_overlap(
+        {'movie_ids': rebuilt['movie_ids'][n_base:], 'neighbor_indices': rebuilt['neighbor_indices'][n_base:]},
+        {'movie_ids': updated['movie_ids'][n_base:], 'neighbor_indices': added}, k
+    )
+
+    print(f"{len(rows)} movies, {len(rows) - n_base} added to a model of {n_base}")
+    print_table(['re-vectorized max error', 'add_s', 'rebuild_s', f'added overlap@{k}'],
+                [[f"{vector_error:.2e}", f"{add_seconds:.2f}", f"{rebuild_seconds:.2f}", f"{overlap:.3f}"]])
+    return 0 if vector_error < 1e-5 and has_neighbors else 1
+
+def check_empty_fields(n_movies=60):
+    """
+    Check that models build in both feature modes when a field has no terms at all:
+    every director NULL and every title a single character (below the token length)
+    """
+    FeatureRow = namedtuple('FeatureRow', ('id',) + model_builder.FEATURE_COLUMNS)
+    rows = [
+        FeatureRow(i, 'a', 'Drama|Action' if i % 2 else 'Comedy', None,
+                   f"Actor {i % 7}, Actor {i % 5}", f"A story about w{i % 11} and w{i % 13}")
+        for i in range(1, n_movies + 1)
+    ]
+
+    failures = 0
+    for mode in ('tfidf', 'hashing'):
+        try:
+            model = model_builder.build_model(iter(rows), mode=mode, top_k=5)
+            built = model['neighbor_indices'].shape == (n_movies, 5)
+        except ValueError as e:
+            print(f"{mode}: build failed: {e}")
+            built = False
+        if built:
+            slices = model['field_slices']
+            print(f"{mode}: built; director columns {slices['director']}, title columns {slices['title']}")
+        failures += not built
+    return 1 if failures else 0
+
+def run_asgi_request(asgi_application, path):
+    """Send one GET request through an ASGI application in-process; returns (status, body)"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 5000)
+    }
+
+    async def request():
+        await asgi_application(scope, receive, send)
+        status = next(message['status'] for message in messages if message['type'] == 'http.response.start')
+        body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+        return status, body
+
+    return request()
+
+def check_asgi_concurrency(n_requests, delay):
+    """
+    Check that the ASGI adapter runs requests concurrently: n_requests that each block
+    for delay seconds must finish in well under n_requests * delay
+    """
+    import asgi
+
+    def blocking_app(environ, start_response):
+        time.sleep(delay)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [threading.current_thread().name.encode()]
+
+    async def run_all():
+        adapter = asgi.ThreadPoolWsgiToAsgi(blocking_app, threads=n_requests)
+        return await asyncio.gather(*(run_asgi_request(adapter, '/') for _ in range(n_requests)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+    threads = {body.decode() for _, body in results}
+
+    # The real app through the same adapter
+    status, _ = asyncio.run(run_asgi_request(asgi.asgi_app, '/api/healthcheck'))
+
+    print(f"{n_requests} requests blocking {delay}s each: {elapsed:.2f}s on {len(threads)} threads")
+    print(f"GET /api/healthcheck through asgi.asgi_app: {status}")
+    if elapsed > delay * 1.5 or status != 200:
+        print("FAIL: requests are not served concurrently")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recommendation model variants")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    feature_modes = subparsers.add_parser('feature-modes', help="Compare hashing and TF-IDF feature modes")
+    feature_modes.add_argument('--k', type=int, default=10)
+
+    precision = subparsers.add_parser('precision', help="Check float32 and quantized scores against float64")
+    precision.add_argument('--k', type=int, default=10)
+
+    lsa = subparsers.add_parser('lsa', help="Compare dense LSA embeddings against sparse TF-IDF vectors")
+    lsa.add_argument('--dims', type=int, nargs='+', default=[64, 128, 256])
+    lsa.add_argument('--k', type=int, default=10)
+
+    candidates = subparsers.add_parser('candidates', help="Compare inverted-index neighbor candidates against the full catalog")
+    candidates.add_argument('--k', type=int, default=10)
+
+    filters = subparsers.add_parser('filters', help="Compare filtered and unfiltered recommendation cost")
+    filters.add_argument('--users', type=int, default=200)
+
+    typeahead_parser = subparsers.add_parser('typeahead', help="Time typeahead prefix lookups")
+    typeahead_parser.add_argument('--queries', type=int, default=2000)
+
+    memory = subparsers.add_parser('memory', help="Compare worker memory with and without preloading before fork")
+    memory.add_argument('--workers', type=int, default=4)
+    memory.add_argument('--requests', type=int, default=50)
+
+    importtime = subparsers.add_parser('importtime', help="Check the app's import time against a budget")
+    importtime.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+
+    add_movies = subparsers.add_parser('add-movies', help="Check adding movies to a hashing model without a refit")
+    add_movies.add_argument('--held-out', type=float, default=0.1)
+    add_movies.add_argument('--k', type=int, default=10)
+
+    subparsers.add_parser('empty-fields', help="Check that models build when a feature field has no terms")
+
+    asgi_parser = subparsers.add_parser('asgi', help="Check that the ASGI adapter serves requests concurrently")
+    asgi_parser.add_argument('--requests', type=int, default=4)
+    asgi_parser.add_argument('--delay', type=float, default=0.5)
+
+    args = parser.parse_args()
+
+    if args.command == 'importtime':
+        sys.exit(check_import_time(args.budget_ms))
+    if args.command == 'empty-fields':
+        sys.exit(check_empty_fields())
+    if args.command == 'asgi':
+        sys.exit(check_asgi_concurrency(args.requests, args.delay))
+    if args.command == 'memory':
+        # Forks workers and manages its own application contexts
+        sys.exit(compare_preload_memory(args.workers, args.requests))
+
+    with app.app_context():
+        if args.command == 'feature-modes':
+            sys.exit(compare_feature_modes(args.k))
+        elif args.command == 'precision':
+            sys.exit(compare_score_precisions(args.k))
+        elif args.command == 'lsa':
+            sys.exit(compare_embedding_dims(args.dims, args.k))
+        elif args.command == 'candidates':
+            sys.exit(compare_neighbor_candidates(args.k))
+        elif args.command == 'filters':
+            sys.exit(compare_filtered_pools(args.users))
+        elif args.command == 'typeahead':
+            sys.exit(measure_typeahead(args.queries))
+        elif args.command == 'add-movies':
+            sys.exit(check_add_movies(args.held_out, args.k))
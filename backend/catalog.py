@@ -0,0 +1,290 @@
+"""
+Columnar in-memory snapshot of the movie catalog
+Holds the columns used for filtering as NumPy arrays sorted by movie ID, with one
+boolean bitmap per genre, so filters on genre, release year, rating and vote
+count are evaluated as vectorized masks instead of SQL or per-object checks
+
+Also computes the movie listing's facet counts (per genre, decade and rating)
+with one vectorized reduction per facet
+
+The snapshot is reloaded when the catalog version (movie count, highest ID and
+latest update) changes, checked at most every CATALOG_TTL seconds
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select, func
+from models import Movie
+from popularity import split_genres
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the catalog version
+CATALOG_TTL = int(os.environ.get('CATALOG_TTL', 300))
+
+# Filter masks kept per snapshot
+FILTER_MASK_CACHE_SIZE = 256
+
+def parse_filters(args):
+    """
+    Parse the filter query parameters: genre, decade (e.g. 1990 or 1990s, shorthand for
+    year_from=1990&year_to=1999), year_from, year_to, min_rating and min_votes
+    Returns a dict of the given filters, or None if there are none
+    Raises ValueError for a malformed value
+    """
+    filters = {}
+
+    genre = (args.get('genre') or '').strip()
+    if genre:
+        filters['genre'] = genre.lower()
+
+    decade = (args.get('decade') or '').strip().rstrip('s')
+    if decade:
+        decade = int(decade) // 10 * 10
+        filters['year_from'] = decade
+        filters['year_to'] = decade + 9
+
+    for name, convert in (('year_from', int), ('year_to', int), ('min_rating', float), ('min_votes', int)):
+        value = args.get(name)
+        if value not in (None, ''):
+            filters[name] = convert(value)
+
+    for name in ('year_from', 'year_to'):
+        if name in filters and not 1 <= filters[name] <= 9999:
+            raise ValueError(f"{name} out of range")
+
+    return filters or None
+
+def filter_key(filters):
+    """Hashable key for a filters dict (None without filters)"""
+    return tuple(sorted(filters.items())) if filters else None
+
+class CatalogSnapshot:
+    """Catalog columns as arrays aligned by position, in ascending movie ID order"""
+
+    def __init__(self, movie_ids, years, vote_averages, vote_counts, popularity, genre_names, genre_bitmaps, version):
+        self.movie_ids = movie_ids  # int64 movie IDs, ascending
+        self.years = years  # int16 release years, 0 when unknown
+        self.vote_averages = vote_averages  # float32
+        self.vote_counts = vote_counts  # int32
+        self.popularity = popularity  # float32
+        self.genre_names = genre_names  # Genre names as first seen in the catalog
+        self.genre_rows = {name.lower(): row for row, name in enumerate(genre_names)}
+        self.genre_bitmaps = genre_bitmaps  # bool (genres x movies), one bitmap row per genre
+        self.version = version
+        self.masks = OrderedDict()  # Filter key -> bitmap of matching positions
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def genre_bitmap(self, genre):
+        """
+        Bitmap of the movies in a genre (case-insensitive); a name that isn't an exact genre
+        matches every genre containing it, like the movie listing's partial matching
+        """
+        genre = genre.lower()
+        if genre in self.genre_rows:
+            return self.genre_bitmaps[self.genre_rows[genre]]
+        rows = [row for name, row in self.genre_rows.items() if genre in name]
+        if not rows:
+            return np.zeros(len(self), dtype=bool)
+        return self.genre_bitmaps[rows].any(axis=0)
+
+    def mask(self, filters):
+        """
+        Get the bitmap of catalog positions whose movies pass the filters
+        Masks are cached per filter, so repeated filters cost one lookup
+        """
+        key = filter_key(filters)
+        with self.lock:
+            mask = self.masks.get(key)
+            if mask is not None:
+                self.masks.move_to_end(key)
+                return mask
+
+        mask = np.ones(len(self), dtype=bool)
+        if filters:
+            if 'genre' in filters:
+                mask &= self.genre_bitmap(filters['genre'])
+            if 'year_from' in filters or 'year_to' in filters:
+                mask &= self.years > 0
+            if 'year_from' in filters:
+                mask &= self.years >= filters['year_from']
+            if 'year_to' in filters:
+                mask &= self.years <= filters['year_to']
+            if 'min_rating' in filters:
+                mask &= self.vote_averages >= filters['min_rating']
+            if 'min_votes' in filters:
+                mask &= self.vote_counts >= filters['min_votes']
+        mask.setflags(write=False)
+
+        with self.lock:
+            self.masks[key] = mask
+            if len(self.masks) > FILTER_MASK_CACHE_SIZE:
+                self.masks.popitem(last=False)
+        return mask
+
+    def facet_counts(self, filters=None, within=None):
+        """
+        Count the movies passing the filters per genre, decade and minimum rating (whole stars)
+        Each facet is counted without its own filter, so its counts show what choosing another
+        value would return; within optionally restricts the counts to a bitmap (e.g. search matches)
+        Returns {'genres': [...], 'decades': [...], 'ratings': [...]}, leaving out empty values
+        """
+        filters = filters or {}
+
+        def facet_mask(own_filters):
+            mask = self.mask({name: value for name, value in filters.items() if name not in own_filters})
+            return mask & within if within is not None else mask
+
+        # Every genre bitmap against the mask at once
+        genre_counts = np.count_nonzero(self.genre_bitmaps & facet_mask(('genre',)), axis=1)
+        genres = sorted(
+            ({'name': name, 'count': int(count)} for name, count in zip(self.genre_names, genre_counts) if count),
+            key=lambda facet: (-facet['count'], facet['name'])
+        )
+
+        years = self.years[facet_mask(('year_from', 'year_to'))]
+        decade_counts = np.bincount(years[years > 0] // 10)
+        decades = np.flatnonzero(decade_counts)
+
+        # Ratings are cumulative like the min_rating filter: the count for 7 is every movie rated 7 or more
+        ratings = self.vote_averages[facet_mask(('min_rating',))]
+        rating_counts = np.bincount(np.clip(ratings, 0, 9).astype(np.int64), minlength=10)
+        rating_counts = np.cumsum(rating_counts[::-1])[::-1]
+
+        return {
+            'genres': genres,
+            'decades': [{'decade': int(decade) * 10, 'count': int(decade_counts[decade])} for decade in decades],
+            'ratings': [{'min': bucket, 'count': int(rating_counts[bucket])}
+                        for bucket in range(9, -1, -1) if rating_counts[bucket]]
+        }
+
+    def positions(self, movie_ids):
+        """Catalog positions of movie IDs, -1 for movies not in the catalog"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(movie_ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.movie_ids, movie_ids)
+        clipped = np.minimum(positions, len(self) - 1)
+        return np.where(self.movie_ids[clipped] == movie_ids, clipped, -1)
+
+    def id_bitmap(self, movie_ids):
+        """Bitmap of the catalog positions of movie IDs (e.g. a search's matches)"""
+        positions = self.positions(movie_ids)
+        bitmap = np.zeros(len(self), dtype=bool)
+        bitmap[positions[positions >= 0]] = True
+        return bitmap
+
+    def popular_ids(self, mask, limit, excluded=()):
+        """
+        Get the IDs of the most popular movies in a mask, skipping excluded movie IDs
+        Returns up to limit movie IDs, most popular first
+        """
+        candidates = np.flatnonzero(mask)
+        if len(excluded):
+            candidates = candidates[~np.isin(self.movie_ids[candidates], np.fromiter(excluded, dtype=np.int64))]
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-self.popularity[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.lexsort((self.movie_ids[candidates], -self.popularity[candidates]))]
+        return self.movie_ids[candidates].tolist()
+
+def catalog_version(session):
+    """Version of the catalog: (movie count, highest movie ID, latest update)"""
+    return tuple(session.execute(
+        select(func.count(Movie.id), func.max(Movie.id), func.max(Movie.updated_at))
+    ).one())
+
+def load_snapshot(session):
+    """Load the catalog columns in one streamed pass; returns a CatalogSnapshot"""
+    version = catalog_version(session)
+
+    movie_ids, years, vote_averages, vote_counts, popularity = [], [], [], [], []
+    genre_positions = {}  # Lowercased genre -> (name, positions of its movies)
+    rows = session.execute(
+        select(Movie.id, Movie.release_date, Movie.genres, Movie.vote_average, Movie.vote_count, Movie.popularity)
+        .order_by(Movie.id)
+        .execution_options(yield_per=1000)
+    )
+    for position, (movie_id, release_date, genres, vote_average, vote_count, movie_popularity) in enumerate(rows):
+        movie_ids.append(movie_id)
+        years.append(release_date.year if release_date else 0)
+        vote_averages.append(vote_average or 0.0)
+        vote_counts.append(vote_count or 0)
+        popularity.append(movie_popularity or 0.0)
+        for genre in split_genres(genres):
+            genre_positions.setdefault(genre.lower(), (genre, []))[1].append(position)
+
+    genre_names = [name for name, _ in genre_positions.values()]
+    genre_bitmaps = np.zeros((len(genre_names), len(movie_ids)), dtype=bool)
+    for row, (_, positions) in enumerate(genre_positions.values()):
+        genre_bitmaps[row, positions] = True
+
+    return CatalogSnapshot(
+        np.array(movie_ids, dtype=np.int64),
+        np.array(years, dtype=np.int16),
+        np.array(vote_averages, dtype=np.float32),
+        np.array(vote_counts, dtype=np.int32),
+        np.array(popularity, dtype=np.float32),
+        genre_names,
+        genre_bitmaps,
+        version
+    )
+
+class CatalogCache:
+    """Holds the current catalog snapshot and reloads it when the catalog changes"""
+
+    def __init__(self, db, ttl=CATALOG_TTL):
+        """Initialize with the database; the snapshot is loaded on first use"""
+        self.db = db
+        self.ttl = ttl
+        self.snapshot = None
+        self.checked_at = None
+        self.refresh_lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the snapshot stale so the next lookup checks the catalog version"""
+        self.checked_at = None
+
+    def refresh(self):
+        """
+        Reload the snapshot if the catalog version changed
+        Must be called inside an application context
+        """
+        session = self.db.session
+        if self.snapshot is not None and catalog_version(session) == self.snapshot.version:
+            self.checked_at = time.time()
+            return
+
+        started = time.time()
+        self.snapshot = load_snapshot(session)
+        self.checked_at = time.time()
+        logger.info(f"Loaded catalog snapshot of {len(self.snapshot)} movies and "
+                    f"{len(self.snapshot.genre_names)} genres in {time.time() - started:.2f}s")
+
+    def get(self):
+        """
+        Get the current snapshot, checking the catalog version when the TTL has passed
+        Only one thread reloads; the others keep using the previous snapshot
+        Must be called inside an application context
+        Returns a CatalogSnapshot
+        """
+        if self.checked_at is not None and time.time() - self.checked_at < self.ttl:
+            return self.snapshot
+
+        # Without a snapshot yet, wait for the loading thread instead of returning nothing
+        blocking = self.snapshot is None
+        if self.refresh_lock.acquire(blocking=blocking):
+            try:
+                if self.checked_at is None or time.time() - self.checked_at >= self.ttl:
+                    self.refresh()
+            finally:
+                self.refresh_lock.release()
+
+        return self.snapshot
@@ -0,0 +1,62 @@
+"""
+Database engine configuration and read-replica routing
+Read-only endpoints can be served from a replica while writes stay on the primary
+"""
+import os
+from flask import g, has_request_context, request, current_app
+from flask_sqlalchemy.session import Session
+
+# Bind key used for the optional read replica engine
+REPLICA_BIND_KEY = 'replica'
+
+def engine_options(uri):
+    """
+    Build SQLAlchemy engine options for a database URI from environment settings
+    Queue pool sizing is skipped for SQLite, which manages its own pool
+    """
+    options = {
+        'pool_pre_ping': os.environ.get('DATABASE_POOL_PRE_PING', 'True').lower() == 'true',
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+    }
+
+    if not str(uri).startswith('sqlite'):
+        options['pool_size'] = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+        options['max_overflow'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
+        options['pool_timeout'] = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+
+    return options
+
+def configure_database(app, primary_uri, replica_uri=None):
+    """Set the primary URI, pool options and optional replica bind on the app config"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = primary_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(primary_uri)
+
+    if replica_uri:
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND_KEY: {'url': replica_uri, **engine_options(replica_uri)}
+        }
+
+def use_read_replica(view):
+    """Mark a view as read-only so its queries may be routed to the read replica"""
+    view.use_read_replica = True
+    return view
+
+def route_request_to_replica():
+    """before_request hook that flags the request for replica reads when the view allows it"""
+    view = current_app.view_functions.get(request.endpoint)
+    g.use_read_replica = getattr(view, 'use_read_replica', False)
+
+class RoutingSession(Session):
+    """
+    Session that sends reads from replica-flagged requests to the replica engine
+    Flushes (inserts, updates, deletes) always go to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and
+                has_request_context() and g.get('use_read_replica')):
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,342 @@
+"""
+Single-statement query helpers for ratings, watchlists and precomputed recommendations
+Each write folds the movie existence check into the statement itself so a
+request only needs one round trip to the database, and batch lookups cover
+a whole page of movies with one query
+"""
+from datetime import datetime
+from sqlalchemy import select, literal, func, and_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from models import Movie, Rating, Watchlist, UserRecommendation
+
+def _dialect_name(session):
+    """Get the dialect name of the engine the session writes to"""
+    name = session.get_bind().dialect.name
+    return 'mysql' if name == 'mariadb' else name
+
+def _insert(session, table):
+    """Create a dialect-specific INSERT supporting upserts"""
+    name = _dialect_name(session)
+    if name == 'mysql':
+        return mysql.insert(table)
+    if name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def _supports_returning(session):
+    """Check whether INSERT ... RETURNING can be used on the session's engine"""
+    return session.get_bind().dialect.insert_returning
+
+def upsert_rating(session, user_id, movie_id, rating_value, review=''):
+    """
+    Insert or update a user's rating with a single INSERT ... SELECT upsert
+    The SELECT from movies makes the statement a no-op when the movie doesn't exist
+    Returns a transient Rating with the stored values, or None if the movie wasn't found
+    """
+    ratings = Rating.__table__
+    movies = Movie.__table__
+    now = datetime.utcnow()
+
+    source = select(
+        literal(user_id), movies.c.id, literal(float(rating_value)), literal(review),
+        literal(now), literal(now)
+    ).where(movies.c.id == movie_id)
+
+    stmt = _insert(session, ratings).from_select(
+        ['user_id', 'movie_id', 'rating', 'review', 'created_at', 'updated_at'], source
+    )
+
+    if _dialect_name(session) == 'mysql':
+        # LAST_INSERT_ID(id) exposes the existing row's id through lastrowid on update
+        stmt = stmt.on_duplicate_key_update(
+            id=func.last_insert_id(ratings.c.id),
+            rating=stmt.inserted.rating,
+            review=stmt.inserted.review,
+            updated_at=stmt.inserted.updated_at
+        )
+        result = session.execute(stmt)
+        if result.rowcount == 0:
+            return None
+
+        # rowcount is 1 for an insert and 2 for an update of an existing row
+        created_at = now if result.rowcount == 1 else None
+        return Rating(id=result.lastrowid, user_id=user_id, movie_id=movie_id,
+                      rating=float(rating_value), review=review,
+                      created_at=created_at, updated_at=now)
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ratings.c.user_id, ratings.c.movie_id],
+        set_={
+            'rating': stmt.excluded.rating,
+            'review': stmt.excluded.review,
+            'updated_at': stmt.excluded.updated_at
+        }
+    )
+
+    if not _supports_returning(session):
+        result = session.execute(stmt)
+        if result.rowcount == 0:
+            return None
+        return Rating(user_id=user_id, movie_id=movie_id, rating=float(rating_value),
+                      review=review, updated_at=now)
+
+    row = session.execute(stmt.returning(*ratings.c)).first()
+    return Rating(**row._mapping) if row else None
+
+def upsert_ratings(session, user_id, items):
+    """
+    Insert or update many ratings for a user with one multi-row upsert
+    items is a list of (movie_id, rating, review), or (movie_id, rating, review, updated_at)
+    to keep the time a rating was made (e.g. for buffered writes); later duplicates win
+    Returns the list of movie ids that were written (unknown movies are skipped)
+    """
+    ratings = Rating.__table__
+    now = datetime.utcnow()
+
+    by_movie = {item[0]: (item[1], item[2], item[3] if len(item) > 3 else now) for item in items}
+    if not by_movie:
+        return []
+
+    existing = existing_movie_ids(session, list(by_movie))
+
+    rows = [
+        {
+            'user_id': user_id,
+            'movie_id': movie_id,
+            'rating': float(rating_value),
+            'review': review,
+            'created_at': updated_at,
+            'updated_at': updated_at
+        }
+        for movie_id, (rating_value, review, updated_at) in by_movie.items() if movie_id in existing
+    ]
+    if not rows:
+        return []
+
+    stmt = _insert(session, ratings).values(rows)
+    if _dialect_name(session) == 'mysql':
+        stmt = stmt.on_duplicate_key_update(
+            rating=stmt.inserted.rating,
+            review=stmt.inserted.review,
+            updated_at=stmt.inserted.updated_at
+        )
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ratings.c.user_id, ratings.c.movie_id],
+            set_={
+                'rating': stmt.excluded.rating,
+                'review': stmt.excluded.review,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+    session.execute(stmt)
+
+    return [row['movie_id'] for row in rows]
+
+def existing_movie_ids(session, movie_ids):
+    """Get the set of the given movie ids that exist, in one query"""
+    movies = Movie.__table__
+    return set(session.execute(select(movies.c.id).where(movies.c.id.in_(movie_ids))).scalars())
+
+def invalidate_user_recommendations(session, user_id):
+    """
+    Drop a user's precomputed recommendations
+    For writes that can't mark them stale by a newer updated_at: deleted ratings, and buffered
+    ratings committed later than their updated_at (see write_behind.py)
+    """
+    table = UserRecommendation.__table__
+    session.execute(table.delete().where(table.c.user_id == user_id))
+
+def delete_rating(session, user_id, movie_id):
+    """
+    Delete a user's rating with a single DELETE, dropping their precomputed recommendations
+    Returns True if a rating was removed
+    """
+    ratings = Rating.__table__
+    result = session.execute(
+        ratings.delete().where(ratings.c.user_id == user_id, ratings.c.movie_id == movie_id)
+    )
+    if result.rowcount > 0:
+        invalidate_user_recommendations(session, user_id)
+    return result.rowcount > 0
+
+def delete_ratings(session, user_id, movie_ids):
+    """
+    Delete a user's ratings for several movies with a single DELETE, dropping their
+    precomputed recommendations
+    Returns the number of ratings removed
+    """
+    ratings = Rating.__table__
+    result = session.execute(
+        ratings.delete().where(ratings.c.user_id == user_id, ratings.c.movie_id.in_(movie_ids))
+    )
+    if result.rowcount > 0:
+        invalidate_user_recommendations(session, user_id)
+    return result.rowcount
+
+def get_movie_rating(session, user_id, movie_id):
+    """
+    Look up a movie and the user's rating for it in one query
+    Returns (movie_exists, Rating or None)
+    """
+    ratings = Rating.__table__
+    movies = Movie.__table__
+
+    row = session.execute(
+        select(movies.c.id.label('found_movie_id'), *ratings.c)
+        .select_from(movies.outerjoin(ratings, and_(
+            ratings.c.movie_id == movies.c.id, ratings.c.user_id == user_id
+        )))
+        .where(movies.c.id == movie_id)
+    ).first()
+
+    if row is None:
+        return False, None
+    if row.id is None:
+        return True, None
+
+    values = {column.name: row._mapping[column] for column in ratings.c}
+    return True, Rating(**values)
+
+def get_ratings_for_movies(session, user_id, movie_ids):
+    """
+    Get the user's ratings for a list of movies in one query
+    Returns a dict of movie_id -> Rating for the movies the user has rated
+    """
+    ratings = Rating.__table__
+    rows = session.execute(
+        select(ratings).where(ratings.c.user_id == user_id, ratings.c.movie_id.in_(movie_ids))
+    )
+    return {row.movie_id: Rating(**row._mapping) for row in rows}
+
+def add_watchlist_item(session, user_id, movie_id, notes=''):
+    """
+    Add a movie to a user's watchlist with a single conflict-ignoring INSERT ... SELECT
+    Returns (status, watchlist_id) where status is 'added', 'exists' or 'not_found'
+    """
+    watchlists = Watchlist.__table__
+    movies = Movie.__table__
+
+    source = select(
+        literal(user_id), movies.c.id, literal(notes), literal(datetime.utcnow())
+    ).where(movies.c.id == movie_id)
+
+    stmt = _insert(session, watchlists).from_select(
+        ['user_id', 'movie_id', 'notes', 'created_at'], source
+    )
+
+    if _dialect_name(session) == 'mysql':
+        result = session.execute(stmt.prefix_with('IGNORE'))
+        if result.rowcount:
+            return 'added', result.lastrowid
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[watchlists.c.user_id, watchlists.c.movie_id])
+        if _supports_returning(session):
+            row = session.execute(stmt.returning(watchlists.c.id)).first()
+            if row:
+                return 'added', row.id
+        else:
+            result = session.execute(stmt)
+            if result.rowcount:
+                return 'added', result.lastrowid
+
+    # Nothing inserted: the movie is missing or already on the watchlist
+    movie_exists, item = get_watchlist_item(session, user_id, movie_id)
+    if not movie_exists:
+        return 'not_found', None
+    return 'exists', item.id
+
+def get_watchlist_item(session, user_id, movie_id):
+    """
+    Look up a movie and the user's watchlist entry for it in one query
+    Returns (movie_exists, Watchlist or None)
+    """
+    watchlists = Watchlist.__table__
+    movies = Movie.__table__
+
+    row = session.execute(
+        select(movies.c.id.label('found_movie_id'), *watchlists.c)
+        .select_from(movies.outerjoin(watchlists, and_(
+            watchlists.c.movie_id == movies.c.id, watchlists.c.user_id == user_id
+        )))
+        .where(movies.c.id == movie_id)
+    ).first()
+
+    if row is None:
+        return False, None
+    if row.id is None:
+        return True, None
+
+    values = {column.name: row._mapping[column] for column in watchlists.c}
+    return True, Watchlist(**values)
+
+def get_watchlist_items_for_movies(session, user_id, movie_ids):
+    """
+    Get the user's watchlist entries for a list of movies in one query
+    Returns a dict of movie_id -> Watchlist for the movies on the watchlist
+    """
+    watchlists = Watchlist.__table__
+    rows = session.execute(
+        select(watchlists).where(watchlists.c.user_id == user_id, watchlists.c.movie_id.in_(movie_ids))
+    )
+    return {row.movie_id: Watchlist(**row._mapping) for row in rows}
+
+def remove_watchlist_item(session, user_id, watchlist_id):
+    """
+    Remove a watchlist entry owned by the user with a single DELETE
+    Returns True if an entry was removed
+    """
+    watchlists = Watchlist.__table__
+    result = session.execute(
+        watchlists.delete().where(watchlists.c.id == watchlist_id, watchlists.c.user_id == user_id)
+    )
+    return result.rowcount > 0
+
+def upsert_user_recommendations(session, rows):
+    """
+    Insert or replace precomputed recommendations with one multi-row upsert
+    rows is a list of dicts with user_id, movie_ids, scores, model_version and computed_at
+    """
+    if not rows:
+        return
+
+    table = UserRecommendation.__table__
+    stmt = _insert(session, table).values(rows)
+    if _dialect_name(session) == 'mysql':
+        stmt = stmt.on_duplicate_key_update(
+            movie_ids=stmt.inserted.movie_ids,
+            scores=stmt.inserted.scores,
+            model_version=stmt.inserted.model_version,
+            computed_at=stmt.inserted.computed_at
+        )
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={
+                'movie_ids': stmt.excluded.movie_ids,
+                'scores': stmt.excluded.scores,
+                'model_version': stmt.excluded.model_version,
+                'computed_at': stmt.excluded.computed_at
+            }
+        )
+    session.execute(stmt)
+
+def get_fresh_user_recommendations(session, user_id, model_version):
+    """
+    Get a user's precomputed recommendations if they are still current, in one query
+    Rows are stale once the user rates anything after they were computed, or when they
+    were computed by another model version than the one serving
+    Returns a UserRecommendation or None
+    """
+    table = UserRecommendation.__table__
+    ratings = Rating.__table__
+
+    newer_rating = select(ratings.c.id).where(
+        ratings.c.user_id == table.c.user_id,
+        ratings.c.updated_at > table.c.computed_at
+    ).exists()
+
+    row = session.execute(
+        select(table).where(table.c.user_id == user_id, table.c.model_version == model_version, ~newer_rating)
+    ).first()
+    return UserRecommendation(**row._mapping) if row else None
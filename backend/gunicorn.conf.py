@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for preforked serving
+The app, recommendation model and popularity rankings are loaded once in the
+master and shared copy-on-write by the workers; run with:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# Import the app in the master before forking workers
+preload_app = True
+
+def when_ready(server):
+    """Build the shared state in the master once the app is loaded, before the first fork"""
+    from app import preload_shared_state
+    preload_shared_state()
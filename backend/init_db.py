@@ -1,22 +1,29 @@
-from app import app, db
-from models import Movie, User, Rating
-import recommender
+from app import app, db, load_model
+from models import Movie
+import omdb_service
+from migrations import run_migrations
 
 def init_database():
-    """Initialize database tables and load sample data"""
-    print("Creating database tables...")
+    """
+    Create or upgrade the schema and load sample data
+    Run this on deploy; serving processes don't create tables themselves
+    """
+    print("Applying database migrations...")
     with app.app_context():
-        db.create_all()
+        run_migrations()
         
         # Check if we have movies in the database
         if Movie.query.count() == 0:
             print("Loading initial movie data...")
-            recommender.load_initial_data()
-            print("Done loading movie data.")
+            result = omdb_service.load_sample_data(db, Movie)
+            print(f"Done loading movie data: {result}")
+            
+            # Build the recommendation model for the new catalog
+            load_model(force=True)
         else:
             print("Database already contains movie data.")
         
     print("Database initialization complete.")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database()
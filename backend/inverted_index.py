@@ -0,0 +1,185 @@
+"""
+Inverted index over the director, actors and genres fields
+Posting lists are the sorted model indices of the movies with each genre or person,
+keyed by the parsed column values (one key per genre name and per person, split
+on '|' and ','), not by the text features' tokens. The keys are collected while
+the model is built and stored with it, so any feature mode (TF-IDF, hashing,
+merged shards) and reweighted models get an index without re-reading the catalog
+
+Used to shortlist neighbor candidates: movies sharing a director or actor,
+plus movies with all of the same genres, so each movie is scored against its
+candidates instead of the whole catalog
+"""
+import re
+from array import array
+import numpy as np
+from scipy import sparse
+
+# Fields whose values select candidates
+PEOPLE_FIELDS = ('director', 'actors')
+GENRE_FIELD = 'genres'
+INDEX_FIELDS = PEOPLE_FIELDS + (GENRE_FIELD,)
+
+# People in more movies than this (e.g. placeholder credits) are too unspecific to select candidates
+MAX_PEOPLE_POSTING = 500
+
+# Genre combinations whose intersected posting lists are kept while building
+GENRE_SET_CACHE_SIZE = 4096
+
+VALUE_SEPARATORS = re.compile(r'[|,]')
+
+def split_values(text):
+    """Split a '|' or ',' separated column value into normalized keys ('Drama|Action' -> ['drama', 'action'])"""
+    keys = []
+    for value in VALUE_SEPARATORS.split(text or ''):
+        key = ' '.join(value.lower().split())
+        if key and key != 'n/a' and key not in keys:
+            keys.append(key)
+    return keys
+
+class MetadataCollector:
+    """Collects each movie's keys per field from streamed feature rows, in row order"""
+
+    def __init__(self):
+        self.vocabularies = {field: {} for field in INDEX_FIELDS}  # Field -> key -> column
+        self.columns = {field: array('i') for field in INDEX_FIELDS}
+        self.indptr = {field: array('q', [0]) for field in INDEX_FIELDS}
+
+    def add(self, rows):
+        """Add the keys of feature rows (Movie objects or streamed rows)"""
+        for row in rows:
+            for field in INDEX_FIELDS:
+                vocabulary = self.vocabularies[field]
+                columns = self.columns[field]
+                columns.extend(vocabulary.setdefault(key, len(vocabulary)) for key in split_values(getattr(row, field)))
+                self.indptr[field].append(len(columns))
+
+    def finish(self):
+        """Returns {field: (keys, movies x keys CSR)}, the metadata stored with the model"""
+        metadata = {}
+        for field, vocabulary in self.vocabularies.items():
+            columns = np.array(self.columns[field], dtype=np.int32)
+            indptr = np.array(self.indptr[field], dtype=np.int64)
+            matrix = sparse.csr_matrix((np.ones(len(columns), dtype=bool), columns, indptr),
+                                       shape=(len(indptr) - 1, len(vocabulary)))
+            metadata[field] = (list(vocabulary), matrix)
+        return metadata
+
+def merge_metadata(parts, order=None):
+    """
+    Merge the metadata of independently built shards into one vocabulary per field
+    Rows are stacked in shard order, then reordered by order (e.g. by movie ID)
+    """
+    metadata = {}
+    for field in INDEX_FIELDS:
+        vocabulary = {}
+        remapped = []  # (matrix, its columns in the merged vocabulary)
+        for part in parts:
+            keys, matrix = part[field]
+            remap = np.array([vocabulary.setdefault(key, len(vocabulary)) for key in keys], dtype=np.int32)
+            remapped.append((matrix, remap[matrix.indices]))
+        merged = sparse.vstack(
+            [sparse.csr_matrix((matrix.data, columns, matrix.indptr), shape=(matrix.shape[0], len(vocabulary)))
+             for matrix, columns in remapped],
+            format='csr'
+        )
+        if order is not None:
+            merged = merged[order]
+        metadata[field] = (list(vocabulary), merged)
+    return metadata
+
+class InvertedIndex:
+    """Posting lists per field and key, stored as CSC arrays of int32 model indices"""
+
+    def __init__(self, metadata):
+        """Build from a model's metadata ({field: (keys, movies x keys CSR)})"""
+        self.n_movies = next(iter(metadata.values()))[1].shape[0]
+        self.keys = {}  # Field -> key per column
+        self.terms = {}  # Field -> CSR of each movie's keys in the field
+        self.postings = {}  # Field -> CSC whose columns are the keys' posting lists
+        self.genre_sets = {}  # Genre columns -> sorted model indices with all of them
+        for field in INDEX_FIELDS:
+            if field not in metadata:
+                continue
+            keys, block = metadata[field]
+            block = block.tocsr()
+            block.sort_indices()
+            postings = block.tocsc()
+            postings.sort_indices()
+            self.keys[field] = keys
+            self.terms[field] = block
+            self.postings[field] = postings
+
+    def posting(self, field, term):
+        """Sorted model indices of the movies with a key of a field"""
+        postings = self.postings[field]
+        return postings.indices[postings.indptr[term]:postings.indptr[term + 1]]
+
+    def movie_terms(self, field, index):
+        """Key columns of a field present in a movie"""
+        terms = self.terms[field]
+        return terms.indices[terms.indptr[index]:terms.indptr[index + 1]]
+
+    def same_genres(self, genres):
+        """Sorted model indices of the movies with all of the given genre columns"""
+        key = tuple(genres)
+        same_genres = self.genre_sets.get(key)
+        if same_genres is not None:
+            return same_genres
+
+        # Intersect the genre posting lists, starting from the shortest
+        postings = sorted((self.posting(GENRE_FIELD, term) for term in genres), key=len)
+        same_genres = postings[0]
+        for posting in postings[1:]:
+            positions = np.minimum(np.searchsorted(posting, same_genres), len(posting) - 1)
+            same_genres = same_genres[posting[positions] == same_genres]
+
+        if len(self.genre_sets) >= GENRE_SET_CACHE_SIZE:
+            self.genre_sets.clear()
+        self.genre_sets[key] = same_genres
+        return same_genres
+
+    def candidates(self, index, limit):
+        """
+        Shortlist up to limit candidate neighbors for a movie (excluding the movie itself)
+        Movies sharing the director or actors come first, ranked by the number of shared people;
+        movies with all of the same genres fill the rest, spread evenly over the catalog
+        Returns an array of model indices
+        """
+        people = [
+            self.posting(field, term)
+            for field in PEOPLE_FIELDS if field in self.postings
+            for term in self.movie_terms(field, index)
+        ]
+        people = [posting for posting in people if len(posting) <= MAX_PEOPLE_POSTING]
+
+        if people:
+            # Union of the posting lists, counting how many people each movie shares
+            shared, counts = np.unique(np.concatenate(people), return_counts=True)
+            keep = shared != index
+            shared, counts = shared[keep], counts[keep]
+            selected = shared[np.argsort(-counts, kind='stable')[:limit]]
+        else:
+            selected = np.empty(0, dtype=np.int32)
+
+        remaining = limit - len(selected)
+        if remaining <= 0 or GENRE_FIELD not in self.postings:
+            return selected
+
+        genres = self.movie_terms(GENRE_FIELD, index)
+        if not len(genres):
+            return selected
+
+        # Spread the picks first, so excluding the movie and its people scans only a sample
+        same_genres = self.same_genres(genres)
+        wanted = remaining + len(selected) + 1
+        if len(same_genres) > wanted:
+            same_genres = same_genres[np.linspace(0, len(same_genres) - 1, wanted).astype(np.int64)]
+        keep = same_genres != index
+        if len(selected):
+            people_sorted = np.sort(selected)
+            positions = np.minimum(np.searchsorted(people_sorted, same_genres), len(people_sorted) - 1)
+            keep &= people_sorted[positions] != same_genres
+        same_genres = same_genres[keep][:remaining]
+
+        return np.concatenate([selected, same_genres]).astype(np.int32)
@@ -0,0 +1,187 @@
+"""
+Schema migrations for the movie recommender database
+Brings existing databases up to date with the models (tables, indexes)
+and records applied versions in a schema_migrations table
+"""
+import sys
+import logging
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert, text, inspect
+from models import db, Movie, Rating, Watchlist, UserRecommendation
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bookkeeping table kept outside the models' metadata so create_all never touches it
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+def _create_tables(connection):
+    """Create any missing tables (and their declared indexes)"""
+    db.metadata.create_all(connection)
+
+def _add_hot_query_indexes(connection):
+    """
+    Add the composite and sort indexes declared on the models
+    Duplicate ratings are collapsed first so the unique (user_id, movie_id) index can be built
+    """
+    ratings = Rating.__table__
+    keep_ids = select(db.func.max(ratings.c.id)).group_by(ratings.c.user_id, ratings.c.movie_id)
+    # MySQL refuses to delete from a table referenced by its own subquery unless it is materialized
+    keep_ids = select(keep_ids.subquery().c[0])
+    result = connection.execute(ratings.delete().where(ratings.c.id.not_in(keep_ids)))
+    if result.rowcount:
+        logger.info(f"Removed {result.rowcount} duplicate ratings before indexing")
+
+    for model in (Movie, Rating, Watchlist):
+        for index in model.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+def _create_user_recommendations(connection):
+    """Create the table holding batch-precomputed recommendations"""
+    UserRecommendation.__table__.create(connection, checkfirst=True)
+
+def _add_user_recommendation_scores(connection):
+    """
+    Add the relevance scores column that precomputed recommendations are re-ranked with
+    Rows stored before it have no scores and are recomputed online until the next batch run
+    """
+    columns = {column['name'] for column in inspect(connection).get_columns('user_recommendations')}
+    if 'scores' not in columns:
+        connection.execute(text("ALTER TABLE user_recommendations ADD COLUMN scores TEXT"))
+
+# Ordered list of (version, description, function); append new migrations at the end
+MIGRATIONS = [
+    (1, "create base tables", _create_tables),
+    (2, "add indexes for hot query columns", _add_hot_query_indexes),
+    (3, "create user_recommendations table", _create_user_recommendations),
+    (4, "add scores to user_recommendations", _add_user_recommendation_scores),
+]
+
+def get_applied_versions(connection):
+    """Get the set of migration versions already applied to the database"""
+    migration_metadata.create_all(connection)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+def run_migrations(engine=None):
+    """
+    Apply all pending migrations in order, each in its own transaction
+    Returns the list of versions that were applied
+    """
+    engine = engine or db.engine
+    applied = []
+
+    with engine.begin() as connection:
+        already_applied = get_applied_versions(connection)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in already_applied:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(insert(schema_migrations).values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+
+    if not applied:
+        logger.info("Database schema is up to date")
+
+    return applied
+
+# Representative statements for each endpoint's hot query path
+def hot_queries():
+    """Get (name, statement) pairs for the queries the API runs on every request"""
+    movies = Movie.__table__
+    ratings = Rating.__table__
+    watchlists = Watchlist.__table__
+    user_recommendations = UserRecommendation.__table__
+
+    queries = []
+    for column in ('popularity', 'vote_average', 'release_date', 'title'):
+        for direction in ('asc', 'desc'):
+            queries.append((
+                f"get_movies sort_by={column} order={direction}",
+                select(movies).order_by(getattr(movies.c[column], direction)()).limit(20).offset(20)
+            ))
+
+    queries += [
+        ("get_movie by tmdb_id", select(movies).where(movies.c.tmdb_id == '111161').limit(1)),
+        ("get_movie_rating", select(ratings).where(ratings.c.user_id == 1, ratings.c.movie_id == 1)),
+        ("get_user_recommendations", select(ratings).where(ratings.c.user_id == 1)),
+        ("get_user_rated_movies",
+            select(ratings, movies)
+            .join(movies, ratings.c.movie_id == movies.c.id)
+            .where(ratings.c.user_id == 1)
+            .order_by(ratings.c.updated_at.desc())
+            .limit(20)),
+        ("get_watchlist",
+            select(watchlists, movies)
+            .join(movies, watchlists.c.movie_id == movies.c.id)
+            .where(watchlists.c.user_id == 1)
+            .order_by(watchlists.c.created_at.desc())
+            .limit(12)),
+        ("check_watchlist", select(watchlists).where(watchlists.c.user_id == 1, watchlists.c.movie_id == 1)),
+        ("get_fresh_user_recommendations",
+            select(user_recommendations)
+            .where(user_recommendations.c.user_id == 1, user_recommendations.c.model_version == 'v1')
+            .where(~select(ratings.c.id).where(
+                ratings.c.user_id == user_recommendations.c.user_id,
+                ratings.c.updated_at > user_recommendations.c.computed_at
+            ).exists())),
+    ]
+    return queries
+
+def check_query_plans(connection):
+    """
+    Run EXPLAIN QUERY PLAN (SQLite) for every hot query
+    Returns a list of (name, plan detail) for queries that scan a table or sort without an index
+    """
+    problems = []
+
+    for name, statement in hot_queries():
+        sql = str(statement.compile(connection, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+        for detail in plan:
+            full_scan = detail.startswith('SCAN') and 'USING' not in detail
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append((name, detail))
+
+    return problems
+
+if __name__ == "__main__":
+    from app import app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+
+    with app.app_context():
+        if command == 'upgrade':
+            applied = run_migrations()
+            print(f"Applied migrations: {applied or 'none'}")
+        elif command == 'check-plans':
+            # Query plans are checked on a scratch SQLite database built by the migrations
+            from sqlalchemy import create_engine
+            engine = create_engine('sqlite://')
+            run_migrations(engine)
+
+            with engine.connect() as connection:
+                problems = check_query_plans(connection)
+
+            for name, detail in problems:
+                print(f"NO INDEX: {name}: {detail}")
+            print(f"Checked {len(hot_queries())} queries, {len(problems)} without index")
+            sys.exit(1 if problems else 0)
+        else:
+            print("Usage: python migrations.py [upgrade|check-plans]")
+            sys.exit(2)
@@ -0,0 +1,820 @@
+"""
+Recommendation model builder
+Builds the content-based model outside the request path: feature fields are
+tokenized and neighbor lists computed in parallel across a process pool, and
+the result is published as an artifact that web workers pick up
+Each field (title, genres, ...) gets its own TF-IDF block; blocks are combined
+with configurable field weights
+"""
+import os
+import sys
+import time
+import hashlib
+import logging
+import itertools
+from array import array
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import joblib
+from scipy import sparse
+from sqlalchemy import select
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.decomposition import TruncatedSVD
+from inverted_index import InvertedIndex, MetadataCollector, merge_metadata
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Vectorizer settings shared by the tokenizer workers and the fitted model
+# max_features applies to each field's vocabulary
+TFIDF_PARAMS = {
+    'stop_words': 'english',
+    'max_features': 5000,
+    'ngram_range': (1, 2)  # Include bigrams for better matching
+}
+
+# Feature mode: 'tfidf' fits a vocabulary over the whole catalog,
+# 'hashing' hashes tokens into a fixed space and keeps IDF statistics instead
+FEATURE_MODE = os.environ.get('RECOMMENDER_FEATURE_MODE', 'tfidf')
+HASHING_FEATURES = 2 ** 18  # Hashed columns per field
+
+# Number of most similar movies kept per movie
+DEFAULT_TOP_K = int(os.environ.get('RECOMMENDER_TOP_K', 50))
+
+# Neighbor candidates: 'all' scores each movie against the whole catalog, 'index' only against
+# up to MAX_CANDIDATES movies shortlisted by the director/actors/genres inverted index
+NEIGHBOR_CANDIDATES = os.environ.get('RECOMMENDER_NEIGHBOR_CANDIDATES', 'all')
+MAX_CANDIDATES = int(os.environ.get('RECOMMENDER_MAX_CANDIDATES', 1000))
+
+# Item vectors and similarity scores are computed and stored in single precision
+VECTOR_DTYPE = np.float32
+
+# Dimensions of the optional dense LSA embeddings; 0 keeps similarities on the sparse vectors
+EMBEDDING_DIM = int(os.environ.get('RECOMMENDER_EMBEDDING_DIM', 0))
+
+# Storage for neighbor scores: 'float32', or 'float16'/'int8' to quantize them further
+SCORE_PRECISIONS = ('float32', 'float16', 'int8')
+SCORE_PRECISION = os.environ.get('RECOMMENDER_SCORE_PRECISION', 'float32')
+
+# Movie columns the features are built from, one block per column
+FEATURE_COLUMNS = ('title', 'genres', 'director', 'actors', 'overview')
+
+# Default weight of each field's block in the combined item vectors
+# (title and genres count double, as they did when their text was repeated)
+DEFAULT_FIELD_WEIGHTS = {
+    'title': 2.0,
+    'genres': 2.0,
+    'director': 1.0,
+    'actors': 1.0,
+    'overview': 1.0
+}
+
+def parse_field_weights(spec):
+    """
+    Parse field weights such as 'title=3,overview=0.5' on top of the defaults
+    Raises ValueError for unknown fields or invalid weights
+    """
+    weights = dict(DEFAULT_FIELD_WEIGHTS)
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        field, _, value = part.partition('=')
+        field = field.strip()
+        if field not in weights:
+            raise ValueError(f"Unknown feature field: {field}")
+        weights[field] = float(value)
+        if weights[field] < 0:
+            raise ValueError(f"Field weight for {field} must not be negative")
+    return weights
+
+# Field weights used for new builds, e.g. RECOMMENDER_FIELD_WEIGHTS="title=3,overview=0.5"
+FIELD_WEIGHTS = parse_field_weights(os.environ.get('RECOMMENDER_FIELD_WEIGHTS'))
+
+# Rows fetched per round trip when streaming the catalog
+STREAM_BATCH_SIZE = 1000
+
+# Rows per unit of parallel work
+TOKENIZE_CHUNK_SIZE = 1000
+
+# Memory budget for one dense block of similarity scores
+NEIGHBOR_BLOCK_BYTES = 64 * 1024 * 1024
+
+def stream_feature_rows(session, Movie, batch_size=STREAM_BATCH_SIZE, shard=None, after_id=None):
+    """
+    Stream (id, title, genres, director, actors, overview) rows in id order
+    Only the feature columns are read, batch_size rows at a time, without building ORM objects
+    shard=(index, count) restricts the stream to movies with id % count == index,
+    after_id to movies with a higher id (e.g. added since a model was built)
+    """
+    columns = [getattr(Movie, name) for name in FEATURE_COLUMNS]
+    statement = select(Movie.id, *columns).order_by(Movie.id)
+
+    if after_id is not None:
+        statement = statement.where(Movie.id > after_id)
+
+    if shard is not None:
+        index, count = shard
+        statement = statement.where(Movie.id % count == index)
+
+    return session.execute(statement.execution_options(yield_per=batch_size))
+
+def field_texts(movie):
+    """
+    Get the lowercased text of each feature field, in FEATURE_COLUMNS order
+    Works with Movie objects and streamed feature rows alike
+    """
+    texts = []
+    for name in FEATURE_COLUMNS:
+        text = getattr(movie, name) or ''
+        if name == 'genres':
+            # Replace pipeline separator with spaces
+            text = text.replace('|', ' ').replace(',', ' ')
+        texts.append(text.lower())
+    return tuple(texts)
+
+def _identity(tokens):
+    """Analyzer for documents that are already tokenized"""
+    return tokens
+
+# Per-process analyzer, built once per worker
+_analyzer = None
+
+def _tokenize_chunk(documents):
+    """
+    Tokenize a chunk of per-field documents with the model's analyzer (runs in worker processes)
+    Tokens are prefixed with their field ("genres:drama") so each field keeps its own vocabulary
+    """
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = TfidfVectorizer(**TFIDF_PARAMS).build_analyzer()
+    return [
+        [f"{field}:{token}" for field, text in zip(FEATURE_COLUMNS, texts) for token in _analyzer(text)]
+        for texts in documents
+    ]
+
+def _chunked(iterable, size):
+    """Yield consecutive lists of at most size items from any iterable"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _bounded_map(executor, func, iterable, max_in_flight):
+    """
+    Like executor.map, but submits lazily so at most max_in_flight results are pending
+    Results are yielded in input order
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_tokens(rows, movie_ids, executor=None, max_in_flight=4, metadata=None):
+    """
+    Stream feature rows into field-prefixed token lists, one per movie
+    Movie IDs are appended to movie_ids, and the inverted index's keys to the optional
+    MetadataCollector, as rows are consumed
+    """
+    def document_chunks():
+        for chunk in _chunked(rows, TOKENIZE_CHUNK_SIZE):
+            movie_ids.extend(row.id for row in chunk)
+            if metadata is not None:
+                metadata.add(chunk)
+            yield [field_texts(row) for row in chunk]
+
+    if executor is None:
+        chunk_tokens = map(_tokenize_chunk, document_chunks())
+    else:
+        chunk_tokens = _bounded_map(executor, _tokenize_chunk, document_chunks(), max_in_flight)
+
+    for tokens in chunk_tokens:
+        yield from tokens
+
+def _top_k_per_row(block, top_k):
+    """Columns and scores of the top_k scores in each row of a dense block, best first"""
+    columns = np.argpartition(-block, top_k - 1, axis=1)[:, :top_k]
+    column_scores = np.take_along_axis(block, columns, axis=1)
+    order = np.argsort(-column_scores, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(column_scores, order, axis=1)
+
+def top_k_neighbors(matrix, start, stop, top_k):
+    """
+    Find the top_k most similar rows for rows start:stop of an L2-normalized matrix
+    The matrix may be sparse item vectors or dense embeddings
+    Returns (indices, scores) arrays of shape (stop - start, top_k), best first
+    """
+    block = matrix[start:stop] @ matrix.T
+    if sparse.issparse(block):
+        block = block.toarray()
+    rows = np.arange(stop - start)
+
+    # A movie is never its own neighbor
+    block[rows, rows + start] = -np.inf
+
+    top_k = min(top_k, matrix.shape[0] - 1)
+    if top_k <= 0:
+        return np.empty((len(rows), 0), dtype=np.int32), np.empty((len(rows), 0), dtype=block.dtype)
+
+    indices, scores = _top_k_per_row(block, top_k)
+    return indices.astype(np.int32), scores
+
+def indexed_neighbors(matrix, index, start, stop, top_k, max_candidates=MAX_CANDIDATES):
+    """
+    Find the top_k most similar rows for rows start:stop among each row's shortlisted candidates
+    The block is scored against the union of its shortlists with one matrix product, and each
+    row's non-candidates are masked out; rows with fewer than top_k candidates (missing director,
+    actors and genres) are scored against the whole catalog instead
+    Returns (indices, scores) arrays of shape (stop - start, top_k), best first
+    """
+    top_k = min(top_k, matrix.shape[0] - 1)
+    indices = np.empty((stop - start, max(top_k, 0)), dtype=np.int32)
+    scores = np.empty((stop - start, max(top_k, 0)), dtype=matrix.dtype)
+    if top_k <= 0:
+        return indices, scores
+
+    shortlists = [index.candidates(row, max_candidates) for row in range(start, stop)]
+    shortlisted = np.array([len(candidates) >= top_k for candidates in shortlists])
+
+    # Rows without enough candidates are scored together against the whole catalog
+    fallback = np.flatnonzero(~shortlisted)
+    if len(fallback):
+        block = matrix[start + fallback] @ matrix.T
+        if sparse.issparse(block):
+            block = block.toarray()
+        block = np.asarray(block)
+        block[np.arange(len(fallback)), start + fallback] = -np.inf
+        indices[fallback], scores[fallback] = _top_k_per_row(block, top_k)
+
+    rows = np.flatnonzero(shortlisted)
+    if not len(rows):
+        return indices, scores
+
+    lengths = np.array([len(shortlists[row]) for row in rows])
+    candidates = np.concatenate([shortlists[row] for row in rows])
+    union = np.unique(candidates)
+
+    block = matrix[start + rows] @ matrix[union].T
+    if sparse.issparse(block):
+        block = block.toarray()
+    block = np.asarray(block)
+
+    # Keep only each row's own candidates
+    row_positions = np.repeat(np.arange(len(rows)), lengths)
+    columns = np.searchsorted(union, candidates)
+    masked = np.full(block.shape, -np.inf, dtype=block.dtype)
+    masked[row_positions, columns] = block[row_positions, columns]
+
+    top, top_scores = _top_k_per_row(masked, top_k)
+    indices[rows], scores[rows] = union[top], top_scores
+    return indices, scores
+
+# Per-process matrix (and inverted index) for neighbor workers, set once by the pool initializer
+_neighbor_matrix = None
+_neighbor_top_k = None
+_neighbor_index = None
+
+def _init_neighbor_worker(matrix, top_k, index=None):
+    """Pool initializer that hands each worker the item matrix once"""
+    global _neighbor_matrix, _neighbor_top_k, _neighbor_index
+    _neighbor_matrix = matrix
+    _neighbor_top_k = top_k
+    _neighbor_index = index
+
+def _neighbor_block(bounds):
+    """Compute neighbors for one row block (runs in worker processes)"""
+    start, stop = bounds
+    if _neighbor_index is not None:
+        return indexed_neighbors(_neighbor_matrix, _neighbor_index, start, stop, _neighbor_top_k)
+    return top_k_neighbors(_neighbor_matrix, start, stop, _neighbor_top_k)
+
+def compute_neighbors(matrix, top_k=DEFAULT_TOP_K, workers=1, index=None):
+    """
+    Compute top_k neighbor lists for every row, partitioning rows into blocks
+    With an inverted index, rows are only scored against their shortlisted candidates
+    Blocks are spread across a process pool when workers > 1
+    """
+    n_rows = matrix.shape[0]
+    # Size row blocks so each dense block of scores stays within the memory budget
+    # (indexed blocks are scored against the union of their shortlists, at most the whole catalog)
+    block_size = max(1, NEIGHBOR_BLOCK_BYTES // (n_rows * matrix.dtype.itemsize))
+    blocks = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_neighbor_worker,
+                                 initargs=(matrix, top_k, index)) as executor:
+            results = list(executor.map(_neighbor_block, blocks))
+    elif index is not None:
+        results = [indexed_neighbors(matrix, index, start, stop, top_k) for start, stop in blocks]
+    else:
+        results = [top_k_neighbors(matrix, start, stop, top_k) for start, stop in blocks]
+
+    indices = np.vstack([block_indices for block_indices, _ in results])
+    scores = np.vstack([block_scores for _, block_scores in results])
+    return indices, scores
+
+def quantize_scores(scores, precision=None):
+    """
+    Convert neighbor scores to their storage precision
+    Returns (stored scores, scale); int8 stores round(score / scale) with scale = 1/127
+    """
+    precision = precision or SCORE_PRECISION
+    if precision == 'int8':
+        # Cosine similarities lie in [-1, 1]
+        scale = 1 / 127
+        return np.round(np.clip(scores, -1, 1) / scale).astype(np.int8), scale
+    if precision == 'float16':
+        return scores.astype(np.float16), None
+    if precision == 'float32':
+        return scores.astype(np.float32), None
+    raise ValueError(f"Unknown score precision: {precision}")
+
+def dequantize_scores(scores, scale=None):
+    """Convert stored neighbor scores (a whole array or a slice) back to float32"""
+    scores = np.asarray(scores, dtype=np.float32)
+    return scores * np.float32(scale) if scale is not None else scores
+
+# Per-process hashing vectorizer, built once per worker
+_hasher = None
+
+def _hashing_vectorizer():
+    """Stateless vectorizer mapping tokens to raw counts in a fixed hashed space"""
+    return HashingVectorizer(
+        n_features=HASHING_FEATURES,
+        alternate_sign=False,
+        norm=None,
+        stop_words=TFIDF_PARAMS['stop_words'],
+        ngram_range=TFIDF_PARAMS['ngram_range']
+    )
+
+def hashed_field_slices():
+    """Column range of each field in a hashed count matrix"""
+    return {
+        field: (i * HASHING_FEATURES, (i + 1) * HASHING_FEATURES)
+        for i, field in enumerate(FEATURE_COLUMNS)
+    }
+
+def _hash_chunk(documents):
+    """
+    Hash a chunk of per-field documents into a sparse count matrix (runs in worker processes)
+    Each field is hashed into its own range of HASHING_FEATURES columns
+    """
+    global _hasher
+    if _hasher is None:
+        _hasher = _hashing_vectorizer()
+    fields = zip(*documents) if documents else [[] for _ in FEATURE_COLUMNS]
+    return sparse.hstack([_hasher.transform(texts) for texts in fields], format='csr')
+
+def build_hashed_shard(rows, executor=None, max_in_flight=4):
+    """
+    Hash streamed feature rows into a shard of term counts and document frequencies
+    Shards need no shared vocabulary, so they can be built independently and merged
+    """
+    movie_ids = array('q')
+    metadata = MetadataCollector()
+
+    def document_chunks():
+        for chunk in _chunked(rows, TOKENIZE_CHUNK_SIZE):
+            movie_ids.extend(row.id for row in chunk)
+            metadata.add(chunk)
+            yield [field_texts(row) for row in chunk]
+
+    if executor is None:
+        chunk_counts = list(map(_hash_chunk, document_chunks()))
+    else:
+        chunk_counts = list(_bounded_map(executor, _hash_chunk, document_chunks(), max_in_flight))
+
+    if not chunk_counts:
+        return None
+
+    counts = sparse.vstack(chunk_counts, format='csr')
+    return {
+        'movie_ids': np.frombuffer(movie_ids, dtype=np.int64).copy(),
+        'counts': counts,
+        'field_slices': hashed_field_slices(),
+        'document_frequency': document_frequency(counts),
+        'n_documents': counts.shape[0],
+        'metadata': metadata.finish()
+    }
+
+def merge_shards(shards):
+    """Merge hashed shards into one, ordered by movie ID"""
+    shards = [shard for shard in shards if shard is not None]
+    movie_ids = np.concatenate([shard['movie_ids'] for shard in shards])
+    counts = sparse.vstack([shard['counts'] for shard in shards], format='csr')
+    order = np.argsort(movie_ids, kind='stable')
+
+    return {
+        'movie_ids': movie_ids[order],
+        'counts': counts[order],
+        'field_slices': shards[0]['field_slices'],
+        'document_frequency': sum(shard['document_frequency'] for shard in shards),
+        'n_documents': sum(shard['n_documents'] for shard in shards),
+        'metadata': merge_metadata([shard['metadata'] for shard in shards], order)
+    }
+
+def document_frequency(counts):
+    """Number of rows each column occurs in"""
+    # CSR rows have no duplicate columns, so column occurrences are document frequencies
+    return np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.int64)
+
+def idf_from_statistics(document_frequency, n_documents):
+    """Smoothed IDF weights, matching TfidfVectorizer(smooth_idf=True)"""
+    return np.log((1 + n_documents) / (1 + document_frequency)) + 1
+
+def field_blocks(counts, idf, field_slices):
+    """
+    IDF-weight raw counts and L2-normalize each field's block on its own
+    Fields without terms (e.g. every director NULL) have zero-width blocks and are skipped
+    Returns the normalized blocks side by side, in field_slices column order
+    """
+    weighted = counts.multiply(idf).tocsr().astype(VECTOR_DTYPE)
+    blocks = [normalize(weighted[:, start:stop]) for start, stop in field_slices.values() if stop > start]
+    if not blocks:
+        return sparse.csr_matrix(weighted.shape, dtype=VECTOR_DTYPE)
+    return sparse.hstack(blocks, format='csr')
+
+def apply_field_weights(field_vectors, field_slices, weights, dtype=VECTOR_DTYPE):
+    """
+    Combine per-field blocks into L2-normalized item vectors using field weights
+    Only scales columns, so weights can be retuned without re-tokenizing the catalog
+    """
+    scale = np.ones(field_vectors.shape[1], dtype=dtype)
+    for field, (start, stop) in field_slices.items():
+        scale[start:stop] = weights.get(field, 1.0)
+    return normalize(field_vectors.astype(dtype) @ sparse.diags(scale)).tocsr()
+
+def vectorize_rows(rows, model):
+    """
+    Vectorize movies or feature rows with a hashing model's stored IDF and field weights
+    New movies can be vectorized this way without refitting the model
+    Returns (field vectors, item vectors) laid out like the model's
+    """
+    counts = _hash_chunk([field_texts(row) for row in rows])
+    field_vectors = field_blocks(counts, model['idf'], model['field_slices'])
+    return field_vectors, apply_field_weights(field_vectors, model['field_slices'], model['field_weights'])
+
+def _weighted_features(feature_mode, movie_ids, counts, field_slices, n_documents, weights, frequencies=None,
+                       metadata=None):
+    """
+    Build per-field TF-IDF blocks from raw counts and combine them with field weights
+    metadata holds the inverted index's keys (see inverted_index.MetadataCollector)
+    """
+    if frequencies is None:
+        frequencies = document_frequency(counts)
+    idf = idf_from_statistics(frequencies, n_documents)
+    field_vectors = field_blocks(counts, idf, field_slices)
+
+    return {
+        'feature_mode': feature_mode,
+        'movie_ids': movie_ids,
+        'field_slices': field_slices,
+        'field_weights': dict(weights),
+        'field_vectors': field_vectors,
+        'item_vectors': apply_field_weights(field_vectors, field_slices, weights),
+        'idf': idf,
+        'document_frequency': frequencies,
+        'n_documents': n_documents,
+        'metadata': metadata
+    }
+
+def _tfidf_features(rows, executor, max_in_flight, weights):
+    """
+    Fit a vocabulary per field over streamed rows
+    Each field keeps its max_features most frequent terms, as TfidfVectorizer would
+    """
+    movie_ids = array('q')
+    metadata = MetadataCollector()
+
+    # Count pre-tokenized documents; stop words and bigrams were applied by the tokenizer
+    vectorizer = CountVectorizer(analyzer=_identity)
+    counts = vectorizer.fit_transform(iter_tokens(rows, movie_ids, executor, max_in_flight, metadata)).tocsr()
+
+    term_fields = np.array([term.partition(':')[0] for term in vectorizer.get_feature_names_out()])
+    term_counts = np.asarray(counts.sum(axis=0)).ravel()
+    del vectorizer
+
+    # Reorder columns so each field's kept terms form one contiguous block
+    columns = []
+    field_slices = {}
+    start = 0
+    for field in FEATURE_COLUMNS:
+        field_columns = np.flatnonzero(term_fields == field)
+        top = np.argsort(-term_counts[field_columns], kind='stable')[:TFIDF_PARAMS['max_features']]
+        field_columns = np.sort(field_columns[top])
+        columns.append(field_columns)
+        field_slices[field] = (start, start + len(field_columns))
+        start += len(field_columns)
+
+    counts = counts[:, np.concatenate(columns)]
+    return _weighted_features('tfidf', np.frombuffer(movie_ids, dtype=np.int64).copy(),
+                              counts, field_slices, counts.shape[0], weights, metadata=metadata.finish())
+
+def _hashed_features(shard, weights):
+    """Turn a (merged) hashed shard into field-weighted item vectors"""
+    return _weighted_features('hashing', shard['movie_ids'], shard['counts'], shard['field_slices'],
+                              shard['n_documents'], weights, shard['document_frequency'], shard.get('metadata'))
+
+def lsa_embeddings(item_vectors, dim):
+    """
+    Project sparse item vectors into dense float32 embeddings with TruncatedSVD (LSA)
+    Returns (L2-normalized C-contiguous embeddings, SVD components), or (None, None) if too few movies
+    """
+    n_components = min(dim, item_vectors.shape[0] - 1, item_vectors.shape[1] - 1)
+    if n_components < 1:
+        return None, None
+
+    svd = TruncatedSVD(n_components=n_components, random_state=0)
+    embeddings = normalize(svd.fit_transform(item_vectors))
+    return np.ascontiguousarray(embeddings, dtype=VECTOR_DTYPE), svd.components_.astype(VECTOR_DTYPE)
+
+def content_version(model):
+    """
+    Version identifying a model by its content (movie IDs, neighbor lists and embeddings)
+    Processes that build from the same catalog and settings agree on it, however built
+    """
+    digest = hashlib.blake2b(digest_size=10)
+    for key in ('movie_ids', 'neighbor_indices', 'neighbor_scores', 'embeddings'):
+        if model.get(key) is not None:
+            digest.update(np.ascontiguousarray(model[key]).tobytes())
+    return digest.hexdigest()
+
+def _finish_model(features, workers, top_k, started, score_precision=None, embedding_dim=None,
+                  candidates=None):
+    """
+    Add neighbor lists and version information to built features
+    With embedding_dim, neighbors are computed on dense LSA embeddings stored with the model
+    With candidates='index', each movie is only scored against its inverted-index shortlist
+    """
+    score_precision = score_precision or SCORE_PRECISION
+    embedding_dim = EMBEDDING_DIM if embedding_dim is None else embedding_dim
+    candidates = candidates or NEIGHBOR_CANDIDATES
+
+    similarity_vectors = features['item_vectors']
+    if embedding_dim:
+        embeddings, components = lsa_embeddings(features['item_vectors'], embedding_dim)
+        if embeddings is not None:
+            features = {**features, 'embeddings': embeddings, 'embedding_components': components}
+            similarity_vectors = embeddings
+
+    if candidates == 'index' and features.get('metadata') is None:
+        # Artifacts built before the index's keys were stored with the model
+        logger.warning("Model has no inverted index metadata; scoring neighbors against the whole catalog")
+        candidates = 'all'
+    index = InvertedIndex(features['metadata']) if candidates == 'index' else None
+    neighbor_indices, neighbor_scores = compute_neighbors(similarity_vectors, top_k, workers, index)
+    neighbor_scores, score_scale = quantize_scores(neighbor_scores, score_precision)
+
+    built_at = datetime.now()
+    logger.info(f"Built {features['feature_mode']} model for {len(features['movie_ids'])} movies "
+                f"with {workers} worker(s) in {time.time() - started:.2f}s")
+
+    model = {
+        **features,
+        'built_at': built_at,
+        'neighbor_indices': neighbor_indices,
+        'neighbor_scores': neighbor_scores,
+        'neighbor_candidates': candidates,
+        'score_precision': score_precision,
+        'score_scale': score_scale
+    }
+    model['version'] = content_version(model)
+    return model
+
+def build_model(rows, workers=1, top_k=DEFAULT_TOP_K, mode=None, weights=None, score_precision=None,
+                embedding_dim=None, candidates=None):
+    """
+    Build the recommendation model from movies or streamed feature rows
+    Rows are consumed once, so only the vectorizer's counts are held in memory, not the catalog
+    Returns a dict with movie ids, item vectors and neighbor lists, or None if there's no data
+    """
+    mode = mode or FEATURE_MODE
+    weights = weights or FIELD_WEIGHTS
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return None
+
+    started = time.time()
+    rows = itertools.chain([first_row], rows)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    try:
+        if mode == 'hashing':
+            features = _hashed_features(build_hashed_shard(rows, executor, 2 * workers), weights)
+        else:
+            features = _tfidf_features(rows, executor, 2 * workers, weights)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return _finish_model(features, workers, top_k, started, score_precision, embedding_dim, candidates)
+
+def build_model_from_shards(shards, workers=1, top_k=DEFAULT_TOP_K, weights=None, score_precision=None,
+                            embedding_dim=None, candidates=None):
+    """Build a hashing-mode model by merging independently built shards"""
+    started = time.time()
+    features = _hashed_features(merge_shards(shards), weights or FIELD_WEIGHTS)
+    return _finish_model(features, workers, top_k, started, score_precision, embedding_dim, candidates)
+
+def reweight_model(model, weights, workers=1, top_k=None, score_precision=None, embedding_dim=None,
+                   candidates=None):
+    """
+    Rebuild a model's item vectors and neighbor lists with new field weights
+    Reuses the cached per-field blocks, so the catalog is not read or tokenized again
+    """
+    started = time.time()
+    top_k = top_k or model['neighbor_indices'].shape[1]
+    if embedding_dim is None:
+        embedding_dim = model['embeddings'].shape[1] if 'embeddings' in model else 0
+    features = {
+        key: value for key, value in model.items()
+        if key not in ('version', 'built_at', 'neighbor_indices', 'neighbor_scores', 'neighbor_candidates',
+                       'score_precision', 'score_scale', 'embeddings', 'embedding_components')
+    }
+    features['field_weights'] = dict(weights)
+    features['item_vectors'] = apply_field_weights(model['field_vectors'], model['field_slices'], weights)
+    return _finish_model(features, workers, top_k, started, score_precision or model.get('score_precision'),
+                         embedding_dim, candidates or model.get('neighbor_candidates'))
+
+def add_movies(model, rows):
+    """
+    Add new movies to a hashing-mode model without refitting it or re-reading the catalog
+    New movies are vectorized with the stored IDF and field weights (and projected onto the
+    stored LSA components) and get neighbor lists over the whole model; existing movies'
+    lists take in new movies more similar than their current neighbors
+    IDF statistics stay as built, so existing vectors remain valid; movies already in the
+    model are skipped
+    Returns the updated model, or the model itself if no movie is new
+    """
+    if model.get('feature_mode') != 'hashing':
+        raise ValueError("Only hashing-mode models can add movies; rebuild a TF-IDF model instead")
+
+    known = set(np.asarray(model['movie_ids']).tolist())
+    rows = [row for row in rows if row.id not in known]
+    if not rows:
+        return model
+
+    started = time.time()
+    field_vectors, item_vectors = vectorize_rows(rows, model)
+    n_old, n_total = len(model['movie_ids']), len(model['movie_ids']) + len(rows)
+
+    features = {
+        key: value for key, value in model.items()
+        if key not in ('version', 'built_at', 'neighbor_indices', 'neighbor_scores')
+    }
+    features['movie_ids'] = np.concatenate([np.asarray(model['movie_ids'], dtype=np.int64),
+                                            np.array([row.id for row in rows], dtype=np.int64)])
+    features['field_vectors'] = sparse.vstack([model['field_vectors'], field_vectors], format='csr')
+    features['item_vectors'] = sparse.vstack([model['item_vectors'], item_vectors], format='csr')
+    if model.get('metadata') is not None:
+        collector = MetadataCollector()
+        collector.add(rows)
+        features['metadata'] = merge_metadata([model['metadata'], collector.finish()])
+
+    similarity_vectors = features['item_vectors']
+    if model.get('embeddings') is not None:
+        new_embeddings = normalize(np.asarray(item_vectors @ model['embedding_components'].T))
+        features['embeddings'] = np.ascontiguousarray(np.vstack([model['embeddings'], new_embeddings]),
+                                                      dtype=VECTOR_DTYPE)
+        similarity_vectors = features['embeddings']
+
+    top_k = model['neighbor_indices'].shape[1]
+    block_size = max(1, NEIGHBOR_BLOCK_BYTES // (n_total * similarity_vectors.dtype.itemsize))
+
+    # New movies against the whole model
+    new_neighbors = [top_k_neighbors(similarity_vectors, start, min(start + block_size, n_total), top_k)
+                     for start in range(n_old, n_total, block_size)]
+
+    # Existing movies keep their best top_k among their current neighbors and the new movies
+    new_columns = np.arange(n_old, n_total, dtype=np.int32)
+    new_vectors = similarity_vectors[n_old:]
+    old_neighbors = []
+    for start in range(0, n_old, block_size):
+        stop = min(start + block_size, n_old)
+        new_scores = similarity_vectors[start:stop] @ new_vectors.T
+        if sparse.issparse(new_scores):
+            new_scores = new_scores.toarray()
+        scores = np.hstack([dequantize_scores(model['neighbor_scores'][start:stop], model['score_scale']),
+                            np.asarray(new_scores, dtype=np.float32)])
+        indices = np.hstack([np.asarray(model['neighbor_indices'][start:stop]),
+                             np.broadcast_to(new_columns, (stop - start, len(new_columns)))])
+        columns, block_scores = _top_k_per_row(scores, top_k)
+        old_neighbors.append((np.take_along_axis(indices, columns, axis=1), block_scores))
+
+    neighbors = old_neighbors + new_neighbors
+    neighbor_indices = np.vstack([indices for indices, _ in neighbors]).astype(np.int32)
+    neighbor_scores, score_scale = quantize_scores(np.vstack([scores for _, scores in neighbors]),
+                                                   model['score_precision'])
+
+    built_at = datetime.now()
+    logger.info(f"Added {len(rows)} movies to the {n_old}-movie model in {time.time() - started:.2f}s")
+
+    updated = {
+        **features,
+        'built_at': built_at,
+        'neighbor_indices': neighbor_indices,
+        'neighbor_scores': neighbor_scores,
+        'score_scale': score_scale
+    }
+    updated['version'] = content_version(updated)
+    return updated
+
+def save_artifact(model, path):
+    """Publish a model artifact atomically so readers never see a partial file"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Published model artifact {model['version']} to {path}")
+
+def load_artifact(path, mmap_mode=None):
+    """
+    Load a published model artifact
+    mmap_mode='r' maps the arrays from the file instead of reading them into memory
+    """
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+if __name__ == "__main__":
+    import argparse
+    from app import app
+    from models import db, Movie
+
+    parser = argparse.ArgumentParser(description="Build and publish the recommendation model")
+    parser.add_argument('--output', default=os.environ.get('RECOMMENDER_MODEL_PATH', 'recommender_model.joblib'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--mode', choices=['tfidf', 'hashing'], default=FEATURE_MODE)
+    parser.add_argument('--shard', help="Build only hashing shard INDEX/COUNT (e.g. 0/4) and write it to --output")
+    parser.add_argument('--merge', nargs='+', metavar='SHARD', help="Merge hashing shard files into a model")
+    parser.add_argument('--weights', type=parse_field_weights, default=FIELD_WEIGHTS,
+                        help="Field weights, e.g. title=3,overview=0.5 (unset fields use the defaults)")
+    parser.add_argument('--score-precision', choices=SCORE_PRECISIONS, default=SCORE_PRECISION)
+    parser.add_argument('--embedding-dim', type=int,
+                        help="Dense LSA embedding size, e.g. 128; 0 disables (default RECOMMENDER_EMBEDDING_DIM, "
+                             "or the artifact's size with --reweight)")
+    parser.add_argument('--candidates', choices=['all', 'index'], default=None,
+                        help="Score neighbors against the whole catalog or only inverted-index candidates "
+                             "(default RECOMMENDER_NEIGHBOR_CANDIDATES, or the artifact's setting with --reweight)")
+    parser.add_argument('--reweight', metavar='ARTIFACT',
+                        help="Apply --weights to an existing model artifact without re-reading the catalog")
+    parser.add_argument('--add-movies', metavar='ARTIFACT',
+                        help="Add movies created since a hashing-mode artifact was built, without refitting it")
+    args = parser.parse_args()
+
+    if args.reweight:
+        model = reweight_model(load_artifact(args.reweight), args.weights, args.workers, args.top_k,
+                               args.score_precision, args.embedding_dim, args.candidates)
+        save_artifact(model, args.output)
+        sys.exit(0)
+
+    if args.add_movies:
+        model = load_artifact(args.add_movies)
+        with app.app_context():
+            rows = stream_feature_rows(db.session, Movie, after_id=int(np.max(model['movie_ids'])))
+            updated = add_movies(model, rows)
+        if updated is model:
+            print("No new movies to add")
+            sys.exit(0)
+        save_artifact(updated, args.output)
+        sys.exit(0)
+
+    if args.merge:
+        model = build_model_from_shards([load_artifact(path) for path in args.merge], args.workers,
+                                        args.top_k, args.weights, args.score_precision, args.embedding_dim,
+                                        args.candidates)
+        save_artifact(model, args.output)
+        sys.exit(0)
+
+    with app.app_context():
+        if args.shard:
+            index, count = (int(part) for part in args.shard.split('/'))
+            rows = stream_feature_rows(db.session, Movie, shard=(index, count))
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                shard = build_hashed_shard(rows, executor, 2 * args.workers)
+            if shard is None:
+                print(f"Shard {args.shard} has no movies")
+                sys.exit(1)
+            joblib.dump(shard, args.output)
+            print(f"Wrote shard {args.shard} with {shard['n_documents']} movies to {args.output}")
+            sys.exit(0)
+
+        model = build_model(stream_feature_rows(db.session, Movie), workers=args.workers,
+                            top_k=args.top_k, mode=args.mode, weights=args.weights,
+                            score_precision=args.score_precision, embedding_dim=args.embedding_dim,
+                            candidates=args.candidates)
+
+    if model is None:
+        print("No movies in database to build recommendation model")
+        sys.exit(1)
+
+    save_artifact(model, args.output)
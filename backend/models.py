@@ -4,9 +4,10 @@ Database models for the movie recommender application
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
+# Initialize SQLAlchemy (the routing session sends reads from read-only endpoints to the replica)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Movie(db.Model):
     """Movie model representing a movie in the database"""
@@ -33,6 +34,12 @@ class Movie(db.Model):
     # This allows the same movie to exist from different data sources
     __table_args__ = (
         db.UniqueConstraint('imdb_id', 'data_source', name='unique_movie_source'),
+        # Indexes backing the sort orders and lookups used by the movie endpoints
+        db.Index('ix_movies_popularity', 'popularity'),
+        db.Index('ix_movies_vote_average', 'vote_average'),
+        db.Index('ix_movies_release_date', 'release_date'),
+        db.Index('ix_movies_title', 'title'),
+        db.Index('ix_movies_tmdb_id', 'tmdb_id'),
     )
     
     def __repr__(self):
@@ -109,6 +116,12 @@ class Rating(db.Model):
     # Keep the movie relationship as backref
     movie = db.relationship('Movie', backref=db.backref('ratings', lazy=True, cascade="all, delete-orphan"))
     
+    # Each user rates a movie once; the composite index also serves user_id-only lookups
+    __table_args__ = (
+        db.Index('ix_ratings_user_movie', 'user_id', 'movie_id', unique=True),
+        db.Index('ix_ratings_user_updated', 'user_id', 'updated_at'),
+    )
+    
     def to_dict(self):
         """Convert rating object to dictionary"""
         return {
@@ -138,6 +151,7 @@ class Watchlist(db.Model):
     # Each user can only have a movie in their watchlist once
     __table_args__ = (
         db.UniqueConstraint('user_id', 'movie_id', name='unique_user_movie_watchlist'),
+        db.Index('ix_watchlists_user_created', 'user_id', 'created_at'),
     )
     
     def to_dict(self):
@@ -148,4 +162,22 @@ class Watchlist(db.Model):
             'movie_id': self.movie_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'notes': self.notes
-        }
\ No newline at end of file
+        }
+    
+class UserRecommendation(db.Model):
+    """Precomputed recommendations for a user, written by batch_recommendations.py"""
+    __tablename__ = 'user_recommendations'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    movie_ids = db.Column(db.Text, nullable=False)  # Comma-separated movie IDs, best first
+    scores = db.Column(db.Text, nullable=True)  # Comma-separated relevance scores, aligned with movie_ids
+    model_version = db.Column(db.String(32), nullable=True)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def get_movie_ids(self):
+        """Get the recommended movie IDs as a list of ints"""
+        return [int(movie_id) for movie_id in self.movie_ids.split(',') if movie_id]
+        
+    def get_scores(self):
+        """Get the relevance scores as a list of floats (empty for rows stored without them)"""
+        return [float(score) for score in (self.scores or '').split(',') if score]
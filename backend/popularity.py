@@ -0,0 +1,184 @@
+"""
+In-memory popularity rankings for cold-start responses
+Keeps the most popular movies overall and per genre, plus an optional trending
+ranking that boosts movies with recent ratings, and refreshes them periodically
+so anonymous and new users are served without touching the database
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import Movie, Rating
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between refreshes of the rankings
+POPULARITY_CACHE_TTL = int(os.environ.get('POPULARITY_CACHE_TTL', 300))
+
+# Movies kept per ranking
+POPULAR_MOVIES_SIZE = 200
+
+# Half-life in days of a rating's boost in the trending ranking; 0 disables trending
+TRENDING_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 0))
+
+# Popularity added by a 5-star rating made just now
+TRENDING_RATING_WEIGHT = 1.0
+
+# Ratings older than this many half-lives no longer count towards trending
+TRENDING_WINDOW_HALF_LIVES = 4
+
+def split_genres(genres):
+    """Split a movie's genres string ('Drama|Crime' or 'Drama, Crime') into names"""
+    return [genre.strip() for genre in (genres or '').replace('|', ',').split(',') if genre.strip()]
+
+class PopularityCache:
+    """Popularity rankings held in memory as serialized movies"""
+
+    def __init__(self, db, ttl=POPULARITY_CACHE_TTL, size=POPULAR_MOVIES_SIZE):
+        """Initialize with the database; rankings are loaded on first use"""
+        self.db = db
+        self.ttl = ttl
+        self.size = size
+        self.rankings = {}  # Lowercased genre ('' for all movies) -> movie dicts, most popular first
+        self.totals = {}  # Lowercased genre -> number of movies in it
+        self.trending = []  # Movie dicts ranked by popularity plus decayed recent ratings
+        self.loaded_at = None
+        self.refresh_lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the rankings stale so the next lookup reloads them"""
+        self.loaded_at = None
+
+    def refresh(self):
+        """
+        Rebuild all rankings in one pass over the catalog's popularity order
+        Must be called inside an application context
+        """
+        started = time.time()
+        session = self.db.session
+
+        rankings = {'': []}
+        totals = {'': 0}
+        rows = session.execute(
+            select(Movie.id, Movie.genres)
+            .order_by(Movie.popularity.desc(), Movie.id)
+            .execution_options(yield_per=1000)
+        )
+        for movie_id, genres in rows:
+            for key in [''] + [genre.lower() for genre in split_genres(genres)]:
+                totals[key] = totals.get(key, 0) + 1
+                ranking = rankings.setdefault(key, [])
+                if len(ranking) < self.size:
+                    ranking.append(movie_id)
+
+        trending_ids = self._trending_ids(session) if TRENDING_HALF_LIFE_DAYS > 0 else []
+
+        # Serialize every ranked movie once
+        movie_ids = set(trending_ids).union(*rankings.values())
+        movies = {}
+        movie_id_list = list(movie_ids)
+        for start in range(0, len(movie_id_list), 500):
+            chunk = movie_id_list[start:start + 500]
+            for movie in session.execute(select(Movie).where(Movie.id.in_(chunk))).scalars():
+                movies[movie.id] = movie.to_dict()
+
+        self.rankings = {key: [movies[i] for i in ids if i in movies] for key, ids in rankings.items()}
+        self.totals = totals
+        self.trending = [movies[i] for i in trending_ids if i in movies]
+        self.loaded_at = time.time()
+
+        logger.info(f"Refreshed popularity rankings for {totals['']} movies and {len(totals) - 1} genres "
+                    f"in {time.time() - started:.2f}s")
+
+    def _trending_ids(self, session):
+        """
+        Rank movies by popularity plus the time-decayed ratings they received recently
+        A rating's boost halves every TRENDING_HALF_LIFE_DAYS
+        """
+        # Imported here so importing the app doesn't load NumPy
+        import numpy as np
+
+        now = datetime.utcnow()
+        since = now - timedelta(days=TRENDING_HALF_LIFE_DAYS * TRENDING_WINDOW_HALF_LIVES)
+        recent = session.execute(
+            select(Rating.movie_id, Rating.rating, Rating.updated_at).where(Rating.updated_at >= since)
+        ).all()
+
+        # Candidates are the popular movies plus anything rated recently
+        candidates = dict(session.execute(
+            select(Movie.id, Movie.popularity).order_by(Movie.popularity.desc()).limit(self.size)
+        ).all())
+
+        if recent:
+            movie_ids, ratings, updated = zip(*recent)
+            ages = np.array([(now - timestamp).total_seconds() / 86400 for timestamp in updated])
+            boosts = TRENDING_RATING_WEIGHT * np.array(ratings) / 5 * 0.5 ** (ages / TRENDING_HALF_LIFE_DAYS)
+
+            unique_ids, positions = np.unique(np.array(movie_ids), return_inverse=True)
+            boost_by_movie = dict(zip(unique_ids.tolist(), np.bincount(positions, weights=boosts).tolist()))
+
+            missing = [movie_id for movie_id in boost_by_movie if movie_id not in candidates]
+            for start in range(0, len(missing), 500):
+                candidates.update(session.execute(
+                    select(Movie.id, Movie.popularity).where(Movie.id.in_(missing[start:start + 500]))
+                ).all())
+        else:
+            boost_by_movie = {}
+
+        scores = {
+            movie_id: (popularity or 0.0) + boost_by_movie.get(movie_id, 0.0)
+            for movie_id, popularity in candidates.items()
+        }
+        return sorted(scores, key=lambda movie_id: (-scores[movie_id], movie_id))[:self.size]
+
+    def ensure_fresh(self):
+        """
+        Reload the rankings when they are older than the TTL
+        Only one thread reloads; the others keep serving the previous rankings
+        """
+        if self.loaded_at is not None and time.time() - self.loaded_at < self.ttl:
+            return
+
+        # Without any rankings yet, wait for the loading thread instead of serving nothing
+        blocking = self.loaded_at is None
+        if not self.refresh_lock.acquire(blocking=blocking):
+            return
+
+        try:
+            if self.loaded_at is None or time.time() - self.loaded_at >= self.ttl:
+                self.refresh()
+        finally:
+            self.refresh_lock.release()
+
+    def get_popular(self, limit, offset=0, genre=None):
+        """
+        Get a page of the most popular movies, optionally in one genre
+        Returns (movie dicts, total matching movies), or None if the page isn't cached
+        """
+        self.ensure_fresh()
+        key = (genre or '').strip().lower()
+        ranking = self.rankings.get(key)
+
+        if ranking is None:
+            # Not an exact genre name; the database's partial matching handles it
+            return None
+
+        # Pages past the kept movies are only cached if the ranking holds every match
+        total = self.totals.get(key, 0)
+        if offset + limit > len(ranking) and len(ranking) < total:
+            return None
+
+        return ranking[offset:offset + limit], total
+
+    def get_cold_start(self, limit):
+        """
+        Get movies for users without ratings: trending when enabled, otherwise the most popular
+        Returns a list of movie dicts
+        """
+        self.ensure_fresh()
+        ranking = self.trending or self.rankings.get('', [])
+        return ranking[:limit]
@@ -0,0 +1,195 @@
+"""
+In-memory per-user rating store
+Holds recently active users' ratings as compact arrays of movie IDs and scores,
+loaded from the database on first use, kept current by the rating endpoints and
+bounded by LRU eviction, so recommendation requests read a user's ratings
+without querying the database. A user's precomputed recommendations are cached
+with their ratings and dropped by any write to them
+"""
+import os
+import time
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from sqlalchemy import select
+from models import Rating
+
+# Users whose ratings are kept in memory
+RATING_STORE_SIZE = int(os.environ.get('RATING_STORE_SIZE', 100000))
+
+# Seconds before a user's ratings are reloaded; bounds how long writes made by
+# other processes (other gunicorn workers, the recommender service, imports, the
+# batch job) stay invisible, as the store is only updated by its own process's writes
+RATING_STORE_TTL = int(os.environ.get('RATING_STORE_TTL', 60))
+
+class UserRatings:
+    """
+    One user's ratings as parallel arrays sorted by movie ID
+    Instances are never modified; writes replace them, so readers need no lock
+    Iterating yields (movie_id, rating) pairs
+    """
+    __slots__ = ('movie_ids', 'ratings', 'version', 'loaded_at', 'precomputed')
+
+    def __init__(self, movie_ids, ratings, version, loaded_at, precomputed=None):
+        self.movie_ids = movie_ids  # array('l') of movie IDs, ascending
+        self.ratings = ratings  # array('f') of ratings, aligned with movie_ids
+        self.version = version  # Changes whenever the ratings change
+        self.loaded_at = loaded_at
+        self.precomputed = precomputed  # (model version, UserRecommendation or None) once looked up
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def __iter__(self):
+        return zip(self.movie_ids, self.ratings)
+
+    def get(self, movie_id):
+        """Get the user's rating for a movie, or None if not rated"""
+        position = bisect.bisect_left(self.movie_ids, movie_id)
+        if position < len(self.movie_ids) and self.movie_ids[position] == movie_id:
+            return self.ratings[position]
+        return None
+
+class RatingStore:
+    """LRU cache of UserRatings, updated on write instead of invalidated"""
+
+    def __init__(self, db, size=RATING_STORE_SIZE, ttl=RATING_STORE_TTL):
+        """Initialize with the database; users are loaded on first use"""
+        self.db = db
+        self.size = size
+        self.ttl = ttl
+        self.users = OrderedDict()  # User ID -> UserRatings, least recently used first
+        self.lock = threading.Lock()
+        self.version = 0  # Incremented on every load and write
+        self.loading = {}  # User ID -> loads in progress
+        self.write_generations = {}  # User ID -> writes seen while loads are in progress, to detect races
+        self.overlay = None  # Optional callable(user_id) -> {movie_id: rating, or None if deleted} of uncommitted writes
+
+    def _next_version(self):
+        """Get a new version number; must be called with the lock held"""
+        self.version += 1
+        return self.version
+        
+    def _record_write(self, user_id):
+        """Note a write for a user whose ratings are being loaded; must be called with the lock held"""
+        if user_id in self.loading:
+            self.write_generations[user_id] = self.write_generations.get(user_id, 0) + 1
+
+    def get(self, user_id):
+        """
+        Get a user's ratings, loading them from the database if not cached or expired
+        Must be called inside an application context when a load may be needed
+        Returns a UserRatings
+        """
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None and time.time() - entry.loaded_at < self.ttl:
+                self.users.move_to_end(user_id)
+                return entry
+            self.loading[user_id] = self.loading.get(user_id, 0) + 1
+            generation = self.write_generations.get(user_id, 0)
+
+        try:
+            # Read uncommitted writes first: any that commit meanwhile are then in the query's results
+            overlay = self.overlay(user_id) if self.overlay is not None else None
+
+            rows = self.db.session.execute(
+                select(Rating.movie_id, Rating.rating)
+                .where(Rating.user_id == user_id)
+                .order_by(Rating.movie_id)
+            ).all()
+
+            if overlay:
+                merged = dict(rows)
+                merged.update(overlay)
+                rows = sorted((movie_id, rating) for movie_id, rating in merged.items() if rating is not None)
+
+            with self.lock:
+                entry = UserRatings(
+                    array('l', (movie_id for movie_id, _ in rows)),
+                    array('f', (rating for _, rating in rows)),
+                    self._next_version(),
+                    time.time()
+                )
+                # A write for this user during the load may be missing from the rows; serve them once but don't cache
+                if self.write_generations.get(user_id, 0) == generation:
+                    self.users[user_id] = entry
+                    self.users.move_to_end(user_id)
+                    if len(self.users) > self.size:
+                        self.users.popitem(last=False)
+
+            return entry
+        finally:
+            with self.lock:
+                self.loading[user_id] -= 1
+                if not self.loading[user_id]:
+                    del self.loading[user_id]
+                    self.write_generations.pop(user_id, None)
+
+    def get_precomputed(self, user_id, model_version, load):
+        """
+        Get a user's precomputed recommendations for a model version, cached with their ratings
+        load() looks them up in the database when the cached ratings don't have them yet;
+        writes replace the ratings, so the next call after one looks them up again
+        Returns a UserRecommendation or None
+        """
+        entry = self.get(user_id)
+        if entry.precomputed is not None and entry.precomputed[0] == model_version:
+            return entry.precomputed[1]
+
+        precomputed = load()
+
+        with self.lock:
+            # Keep it only if the ratings weren't written or reloaded meanwhile
+            if self.users.get(user_id) is entry:
+                self.users[user_id] = UserRatings(entry.movie_ids, entry.ratings, entry.version,
+                                                  entry.loaded_at, (model_version, precomputed))
+        return precomputed
+
+    def has_pending(self, user_id):
+        """Check whether a user has uncommitted writes (in the overlay), which the database doesn't show yet"""
+        return self.overlay is not None and bool(self.overlay(user_id))
+
+    def set_ratings(self, user_id, items):
+        """
+        Record committed ratings for a user; items is a list of (movie_id, rating)
+        Users not in the store are left to load from the database on next use
+        """
+        with self.lock:
+            self._record_write(user_id)
+            entry = self.users.get(user_id)
+            if entry is None:
+                return
+
+            movie_ids, ratings = array('l', entry.movie_ids), array('f', entry.ratings)
+            for movie_id, rating in items:
+                position = bisect.bisect_left(movie_ids, movie_id)
+                if position < len(movie_ids) and movie_ids[position] == movie_id:
+                    ratings[position] = rating
+                else:
+                    movie_ids.insert(position, movie_id)
+                    ratings.insert(position, rating)
+
+            self.users[user_id] = UserRatings(movie_ids, ratings, self._next_version(), entry.loaded_at)
+
+    def set_rating(self, user_id, movie_id, rating):
+        """Record a committed rating for a user"""
+        self.set_ratings(user_id, [(movie_id, rating)])
+
+    def delete_rating(self, user_id, movie_id):
+        """Record a committed rating deletion for a user"""
+        with self.lock:
+            self._record_write(user_id)
+            entry = self.users.get(user_id)
+            if entry is None:
+                return
+
+            position = bisect.bisect_left(entry.movie_ids, movie_id)
+            if position == len(entry.movie_ids) or entry.movie_ids[position] != movie_id:
+                return
+
+            movie_ids, ratings = array('l', entry.movie_ids), array('f', entry.ratings)
+            del movie_ids[position]
+            del ratings[position]
+            self.users[user_id] = UserRatings(movie_ids, ratings, self._next_version(), entry.loaded_at)
@@ -3,111 +3,203 @@ Movie recommender system logic
 Implementation of content-based filtering with enhanced refresh capabilities
 """
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
-import random
 from datetime import datetime
 import traceback
 import os
+import threading
+from collections import OrderedDict
+from flask import current_app
+import model_builder
+from rating_store import RatingStore
+from catalog import CatalogCache, filter_key
 
 # Configure logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Diversity re-ranking: 1.0 ranks purely by similarity, lower values favor variety
+MMR_LAMBDA = float(os.environ.get('RECOMMENDER_MMR_LAMBDA', 0.7))
+# Scale of the seeded random jitter added to relevance before re-ranking
+MMR_JITTER = float(os.environ.get('RECOMMENDER_MMR_JITTER', 0.02))
+# Neighbors considered per requested recommendation
+MMR_CANDIDATE_FACTOR = 4
+
+# Re-ranked neighbor lists kept per model version
+RECOMMENDATION_CACHE_SIZE = 10000
+
+# Seconds after which an in-process model is rebuilt from the database, in the background, on next use
+MODEL_REBUILD_SECONDS = 1800
+
+# Candidates kept per user for paging through refreshes, and users kept in the cache
+CANDIDATE_POOL_SIZE = 200
+CANDIDATE_POOL_CACHE_SIZE = 10000
+
+# Users whose refresh counts are kept; an evicted user's refreshes start again from the second page
+REFRESH_COUNT_CACHE_SIZE = 10000
+
+# Filter bitmaps over model indices kept per model and catalog snapshot
+FILTER_MASK_CACHE_SIZE = 256
+
+def mmr_rerank(similarities, relevance, limit, diversity_lambda=MMR_LAMBDA, jitter=0.0, rng=None):
+    """
+    Select up to limit candidates by maximal marginal relevance
+    similarities is the candidates' pairwise similarity matrix, relevance their similarity to the query
+    Returns positions into the candidate list, in selection order
+    """
+    n_candidates = len(relevance)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if jitter and rng is not None:
+        relevance = relevance + rng.uniform(0, jitter, n_candidates).astype(np.float32)
+
+    selected = []
+    max_similarity = np.zeros(n_candidates, dtype=np.float32)  # Closest already selected candidate
+    available = np.ones(n_candidates, dtype=bool)
+
+    for _ in range(min(limit, n_candidates)):
+        scores = diversity_lambda * relevance - (1 - diversity_lambda) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarities[best], out=max_similarity)
+
+    return selected
+
+def movies_by_id(Movie, movie_ids):
+    """Fetch movie objects for movie IDs in one query, preserving their order"""
+    if not movie_ids:
+        return []
+        
+    movies = {movie.id: movie for movie in Movie.query.filter(Movie.id.in_(movie_ids)).all()}
+    return [movies[movie_id] for movie_id in movie_ids if movie_id in movies]
+
 class MovieRecommender:
     """Movie recommender class for generating movie recommendations"""
     
-    def __init__(self, db, Movie):
-        """Initialize with database and Movie model"""
+    def __init__(self, db, Movie, rating_store=None, catalog=None):
+        """Initialize with database and Movie model, sharing the app's rating store and catalog if given"""
         self.db = db
         self.Movie = Movie
-        self.similarity_matrix = None
-        self.movie_indices = {}
+        self.rating_store = rating_store or RatingStore(db)
+        self.catalog = catalog or CatalogCache(db)
+        self.movie_ids = None  # Model index -> movie ID
+        self.movie_indices = {}  # Movie ID -> model index
+        self.item_vectors = None
+        self.embeddings = None  # Dense LSA embeddings, when the model has them
+        self.neighbor_indices = None  # Top-K most similar movies per movie, best first
+        self.neighbor_scores = None  # Stored at the model's score precision
+        self.score_scale = None
+        self.score_precision = None
+        self.feature_mode = None
+        self.model_version = None
         self.last_model_update = None
-        self.refresh_counts = {}  # Track refreshes by user
-        self.last_recommendations = {}  # Track recommendations by user
+        # None disables time-based rebuilds: the model then only changes with the published artifact or on force
+        self.rebuild_interval = MODEL_REBUILD_SECONDS
+        self.rebuild_lock = threading.Lock()  # Held while a model is built, so only one thread builds
+        self.recommendation_cache = OrderedDict()  # (movie ID, limit, seed) -> model indices
+        self.cache_lock = threading.Lock()
+        self.candidate_pools = OrderedDict()  # (User ID, filter key) -> (fingerprint, model indices, relevance)
+        self.catalog_positions = (None, None)  # ((model version, snapshot version), catalog position per model index)
+        self.filter_masks = OrderedDict()  # (model version, snapshot version, filter key) -> bitmap of model indices
+        self.refresh_counts = OrderedDict()  # User ID -> refreshes, least recently refreshed first
+        
+        # Published model artifact (built by model_builder.py) that workers load instead of training
+        self.artifact_path = os.environ.get('RECOMMENDER_MODEL_PATH')
+        self.artifact_mtime = None
+        
+    def _apply_model(self, model):
+        """Swap in a built or loaded model"""
+        self.movie_indices = {int(movie_id): i for i, movie_id in enumerate(model['movie_ids'])}
+        self.movie_ids = model['movie_ids']
+        self.item_vectors = model['item_vectors']
+        self.embeddings = model.get('embeddings')
+        self.neighbor_indices = model['neighbor_indices']
+        self.neighbor_scores = model['neighbor_scores']
+        self.score_scale = model.get('score_scale')
+        self.score_precision = model.get('score_precision', str(model['neighbor_scores'].dtype))
+        self.feature_mode = model.get('feature_mode', 'tfidf')
+        self.model_version = model['version']
+        self.last_model_update = model['built_at']
+        with self.cache_lock:
+            self.recommendation_cache.clear()
+            self.filter_masks.clear()
+        
+    def _load_published_model(self, force=False):
+        """
+        Load the published model artifact if it changed since it was last loaded
+        Returns True if a published model is in use
+        """
+        if not self.artifact_path or not os.path.exists(self.artifact_path):
+            return False
+            
+        mtime = os.path.getmtime(self.artifact_path)
+        if force or mtime != self.artifact_mtime:
+            # Map the arrays read-only so workers share the artifact's pages
+            self._apply_model(model_builder.load_artifact(self.artifact_path, mmap_mode='r'))
+            self.artifact_mtime = mtime
+            logger.info(f"Loaded recommendation model {self.model_version} from {self.artifact_path}")
+            
+        return True
         
-    def initialize_recommendation_model(self, force=False):
+    def initialize_recommendation_model(self, force=False, rebuild_stale=True):
         """
         Initialize and train the recommendation model
         This doesn't fetch data, just uses what's in the database
+        Loads the published artifact when RECOMMENDER_MODEL_PATH points at one
+        A stale model is rebuilt in the background while it keeps serving; only the first
+        build (or a forced one) runs on the calling thread
         
         Args:
             force: If True, force rebuild even if recently updated
+            rebuild_stale: If False, keep a loaded model however old it is (a model is still
+                built if none is loaded)
         """
+        try:
+            if self._load_published_model(force=force):
+                return True
+        except Exception as e:
+            logger.error(f"Error loading published recommendation model: {str(e)}")
+            logger.error(traceback.format_exc())
+            
         current_time = datetime.now()
         
-        # Skip rebuilding if we've done it recently (within 30 minutes), unless forced
-        if (not force and self.last_model_update and 
-            (current_time - self.last_model_update).total_seconds() < 1800):
+        # Skip rebuilding if we've done it recently (within 30 minutes) or never rebuild on a timer, unless forced
+        if (not force and self.last_model_update and
+            (not rebuild_stale or self.rebuild_interval is None or
+             (current_time - self.last_model_update).total_seconds() < self.rebuild_interval)):
             logger.info(f"Skipping model rebuild - last update was {self.last_model_update}")
             return True
             
-        try:
-            # Get all movies from database
-            movies = self.Movie.query.all()
+        # A stale model keeps serving while it is rebuilt in the background
+        if not force and self.neighbor_indices is not None:
+            self._start_background_rebuild()
+            return True
             
-            if not movies:
-                logger.warning("No movies in database to build recommendation model")
-                return False
-                
-            logger.info(f"Building recommendation model with {len(movies)} movies")
+        # Without a model yet (or when forced), wait for the building thread instead of serving nothing
+        with self.rebuild_lock:
+            if not force and self.neighbor_indices is not None:
+                return True
+            return self._build_model()
             
-            # Create features for content-based filtering
-            # Combine title, overview, genres, director, actors for better recommendations
-            features = []
+    def _build_model(self):
+        """
+        Build the model from the database and swap it in
+        Must be called inside an application context, holding rebuild_lock
+        Returns True when the model is usable
+        """
+        try:
+            # Stream only the feature columns instead of loading every Movie object
+            rows = model_builder.stream_feature_rows(self.db.session, self.Movie)
             
-            # Reset movie indices
-            self.movie_indices = {}
+            # Build in-process; use model_builder.py to build across cores and publish an artifact
+            model = model_builder.build_model(rows)
             
-            for i, movie in enumerate(movies):
-                # Store movie index mapping
-                self.movie_indices[movie.id] = i
-                
-                # Combine features
-                movie_features = []
-                
-                if movie.title:
-                    # Weight title more heavily
-                    movie_features.append(movie.title + " " + movie.title)
-                    
-                if movie.genres:
-                    # Replace pipeline separator with spaces and weight genres
-                    genres = movie.genres.replace('|', ' ').replace(',', ' ')
-                    movie_features.append(genres + " " + genres)
-                    
-                if movie.director:
-                    movie_features.append(movie.director)
-                    
-                if movie.actors:
-                    movie_features.append(movie.actors)
-                    
-                if movie.overview:
-                    movie_features.append(movie.overview)
-                    
-                features.append(' '.join(movie_features).lower())
-            
-            # Check if we have enough data to proceed
-            if not features:
-                logger.warning("No valid features found for movies")
+            if model is None:
+                logger.warning("No movies in database to build recommendation model")
                 return False
                 
-            # Create TF-IDF vectorizer with improved parameters
-            tfidf = TfidfVectorizer(
-                stop_words='english',
-                max_features=5000,
-                ngram_range=(1, 2)  # Include bigrams for better matching
-            )
-            
-            # Generate TF-IDF matrix
-            tfidf_matrix = tfidf.fit_transform(features)
-            
-            # Compute similarity matrix
-            self.similarity_matrix = cosine_similarity(tfidf_matrix, tfidf_matrix)
-            
-            # Update last model update timestamp
-            self.last_model_update = current_time
+            self._apply_model(model)
             
             logger.info(f"Successfully built recommendation model at {self.last_model_update}")
             return True
@@ -117,17 +209,63 @@ class MovieRecommender:
             logger.error(traceback.format_exc())
             return False
             
-    def get_recommendations(self, movie_id, limit=5):
+    def _start_background_rebuild(self):
+        """
+        Rebuild the model in a background thread with its own application context
+        Only one thread rebuilds; if one already is, this returns without waiting
+        """
+        app = current_app._get_current_object()
+        if not self.rebuild_lock.acquire(blocking=False):
+            return
+            
+        def run():
+            try:
+                with app.app_context():
+                    self._build_model()
+            finally:
+                self.rebuild_lock.release()
+                
+        try:
+            threading.Thread(target=run, name='model-rebuild', daemon=True).start()
+        except Exception:
+            self.rebuild_lock.release()
+            raise
+            
+    def _movies_by_index(self, indices):
+        """Fetch movie objects for model indices, preserving their order"""
+        return self._movies_by_id([int(self.movie_ids[i]) for i in indices])
+        
+    def _movies_by_id(self, movie_ids):
+        """Fetch movie objects for movie IDs, preserving their order"""
+        return movies_by_id(self.Movie, movie_ids)
+            
+    def _diversify(self, candidates, relevance, limit, seed=None):
+        """
+        Re-rank candidate model indices with MMR over their embeddings or item vectors
+        Returns up to limit model indices
+        """
+        if self.embeddings is not None:
+            vectors = self.embeddings[candidates]
+            similarities = vectors @ vectors.T
+        else:
+            vectors = self.item_vectors[candidates]
+            similarities = (vectors @ vectors.T).toarray()
+        rng = np.random.default_rng(seed)
+        selected = mmr_rerank(similarities, relevance, limit, jitter=MMR_JITTER, rng=rng)
+        return [int(candidates[i]) for i in selected]
+        
+    def get_recommendations(self, movie_id, limit=5, seed=None):
         """
         Get movie recommendations based on a movie ID
+        Neighbors are re-ranked for diversity; results are stable for a given seed and cached
         Returns a list of movie objects
         """
         try:
             # Check if model is initialized
-            if self.similarity_matrix is None:
+            if self.neighbor_indices is None:
                 logger.warning("Recommendation model not initialized")
                 self.initialize_recommendation_model()
-                if self.similarity_matrix is None:
+                if self.neighbor_indices is None:
                     return []
                 
             # Check if the movie exists in our mapping
@@ -135,226 +273,277 @@ class MovieRecommender:
                 logger.warning(f"Movie ID {movie_id} not found in recommendation model")
                 return []
                 
-            # Get the index of the movie
-            idx = self.movie_indices[movie_id]
-            
-            # Get similarity scores for the movie
-            sim_scores = list(enumerate(self.similarity_matrix[idx]))
-            
-            # Sort movies by similarity score (excluding the movie itself)
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:limit+20]  # Get extra for diversity
-            
-            # Add some randomness to the recommendations
-            random.shuffle(sim_scores)
-            sim_scores = sorted(sim_scores[:limit+10], key=lambda x: x[1], reverse=True)[:limit]
-            
-            # Get movie IDs
-            movie_indices = [i[0] for i in sim_scores]
+            # Default to a per-movie seed so repeated requests agree
+            seed = movie_id if seed is None else seed
+            cache_key = (movie_id, limit, seed)
+            
+            with self.cache_lock:
+                indices = self.recommendation_cache.get(cache_key)
+                if indices is not None:
+                    self.recommendation_cache.move_to_end(cache_key)
+                    
+            if indices is None:
+                # Get the index of the movie
+                idx = self.movie_indices[movie_id]
+                
+                # Neighbor lists are sorted by similarity and exclude the movie itself
+                n_candidates = limit * MMR_CANDIDATE_FACTOR
+                candidates = np.asarray(self.neighbor_indices[idx][:n_candidates])
+                relevance = model_builder.dequantize_scores(self.neighbor_scores[idx][:n_candidates], self.score_scale)
+                indices = self._diversify(candidates, relevance, limit, seed)
+                
+                with self.cache_lock:
+                    self.recommendation_cache[cache_key] = indices
+                    if len(self.recommendation_cache) > RECOMMENDATION_CACHE_SIZE:
+                        self.recommendation_cache.popitem(last=False)
             
             # Get movie objects
-            recommended_movies = []
-            all_movies = self.Movie.query.all()
-            
-            for idx in movie_indices:
-                if idx < len(all_movies):
-                    recommended_movies.append(all_movies[idx])
-            
-            return recommended_movies
+            return self._movies_by_index(indices)
             
         except Exception as e:
             logger.error(f"Error getting recommendations: {str(e)}")
             logger.error(traceback.format_exc())
             return []
             
-    def get_user_recommendations(self, user_id, limit=5):
+    def _user_ratings(self, user_id):
+        """Get a user's ratings from the rating store (a UserRatings of (movie_id, rating) pairs)"""
+        return self.rating_store.get(user_id)
+        
+    def _filter_mask(self, filters):
         """
-        Get movie recommendations based on user's past ratings
+        Get the bitmap of model indices whose movies pass the filters (see catalog.parse_filters)
+        Built once per model, catalog snapshot and filter from the snapshot's per-facet bitmaps
+        Returns (bitmap, key identifying it), or (None, None) without filters
+        """
+        if not filters:
+            return None, None
+            
+        snapshot = self.catalog.get()
+        key = (self.model_version, snapshot.version, filter_key(filters))
+        with self.cache_lock:
+            mask = self.filter_masks.get(key)
+            if mask is not None:
+                self.filter_masks.move_to_end(key)
+                return mask, key
+            positions_key, positions = self.catalog_positions
+            
+        if positions_key != key[:2]:
+            positions = snapshot.positions(self.movie_ids)
+            
+        found = positions >= 0
+        mask = np.zeros(len(positions), dtype=bool)
+        mask[found] = snapshot.mask(filters)[positions[found]]
+        
+        with self.cache_lock:
+            self.catalog_positions = (key[:2], positions)
+            self.filter_masks[key] = mask
+            if len(self.filter_masks) > FILTER_MASK_CACHE_SIZE:
+                self.filter_masks.popitem(last=False)
+                
+        return mask, key
+        
+    def _candidate_pool(self, user_id, ratings, filters=None):
+        """
+        Get a user's candidate pool: unrated movies ranked by their summed similarity to liked movies
+        (with LSA embeddings, by similarity to the sum of the liked movies' embeddings)
+        Filters mask out non-matching movies before the pool's top candidates are selected
+        Pools are cached per user and filter and rebuilt only when the model, the catalog
+        snapshot (when filtered) or the user's ratings change
+        Returns (model indices, relevance in [0, 1]), best first
+        """
+        mask, mask_key = self._filter_mask(filters)
+        pool_key = (user_id, filter_key(filters))
+        fingerprint = (self.model_version, ratings.version, mask_key)
+        with self.cache_lock:
+            cached = self.candidate_pools.get(pool_key)
+            if cached is not None and cached[0] == fingerprint:
+                self.candidate_pools.move_to_end(pool_key)
+                return cached[1], cached[2]
+                
+        # Highly rated movies (rating >= 4.0) that are in the model
+        liked = [self.movie_indices[movie_id] for movie_id, rating in ratings
+                 if rating >= 4.0 and movie_id in self.movie_indices]
+        rated = [self.movie_indices[movie_id] for movie_id, _ in ratings if movie_id in self.movie_indices]
+        
+        candidates = np.empty(0, dtype=np.int32)
+        relevance = np.empty(0, dtype=np.float32)
+        
+        if liked and self.embeddings is not None:
+            # Score every movie against the user's profile with one dense matrix-vector product
+            scores = self.embeddings @ self.embeddings[liked].sum(axis=0)
+            scores[rated] = -np.inf
+            if mask is not None:
+                scores[~mask] = -np.inf
+            
+            pool_size = min(CANDIDATE_POOL_SIZE, int(np.count_nonzero(scores > -np.inf)))
+            if pool_size > 0:
+                top = np.argpartition(-scores, pool_size - 1)[:pool_size]
+                candidates = top[np.argsort(-scores[top], kind='stable')].astype(np.int32)
+                relevance = scores[candidates].astype(np.float32)
+                
+                if relevance[0] > 0:
+                    relevance /= relevance[0]
+                    
+        elif liked:
+            # Sum each neighbor's similarity over all liked movies
+            neighbors = np.asarray(self.neighbor_indices[liked]).ravel()
+            scores = model_builder.dequantize_scores(self.neighbor_scores[liked], self.score_scale).ravel()
+            candidates, positions = np.unique(neighbors, return_inverse=True)
+            relevance = np.bincount(positions, weights=scores).astype(np.float32)
+            
+            # Remove movies the user has already rated and keep the best candidates
+            keep = ~np.isin(candidates, rated)
+            if mask is not None:
+                keep &= mask[candidates]
+            candidates, relevance = candidates[keep], relevance[keep]
+            order = np.argsort(-relevance, kind='stable')[:CANDIDATE_POOL_SIZE]
+            candidates, relevance = candidates[order], relevance[order]
+            
+            # Scale relevance to [0, 1] so the MMR lambda means the same as for single movies
+            if len(relevance) and relevance[0] > 0:
+                relevance /= relevance[0]
+                
+        with self.cache_lock:
+            self.candidate_pools[pool_key] = (fingerprint, candidates, relevance)
+            self.candidate_pools.move_to_end(pool_key)
+            if len(self.candidate_pools) > CANDIDATE_POOL_CACHE_SIZE:
+                self.candidate_pools.popitem(last=False)
+                
+        return candidates, relevance
+        
+    def _recommendation_page(self, user_id, limit, page, ratings=None, filters=None):
+        """
+        Get one page of a user's recommendations from their (optionally filtered) candidate pool
+        Each page re-ranks the next window of candidates with MMR, seeded per user and page,
+        and wraps around at the end of the pool; popular unrated movies fill a short page
         Returns a list of movie objects
         """
-        try:
-            from models import Rating
-            
-            # Get user's ratings
-            ratings = Rating.query.filter_by(user_id=user_id).all()
+        if ratings is None:
+            ratings = self._user_ratings(user_id)
+        
+        if not ratings:
+            logger.info(f"No ratings found for user {user_id}")
+            return []
             
-            if not ratings:
-                logger.info(f"No ratings found for user {user_id}")
+        if self.neighbor_indices is None:
+            self.initialize_recommendation_model()
+            if self.neighbor_indices is None:
                 return []
                 
-            # Get highly rated movies (rating >= 4.0)
-            liked_movies = [r.movie_id for r in ratings if r.rating >= 4.0]
+        candidates, relevance = self._candidate_pool(user_id, ratings, filters)
+        
+        if not len(candidates):
+            logger.info(f"No highly rated movies found for user {user_id}")
+            return []
             
-            if not liked_movies:
-                logger.info(f"No highly rated movies found for user {user_id}")
-                return []
+        window = limit * MMR_CANDIDATE_FACTOR
+        n_pages = -(-len(candidates) // window)
+        start = (page % n_pages) * window
+        
+        indices = self._diversify(candidates[start:start + window], relevance[start:start + window],
+                                  limit, seed=[user_id, page])
+        recommended = self._movies_by_index(indices)
+        
+        # If there aren't enough candidates on this page, add popular movies the user hasn't rated
+        if len(recommended) < limit:
+            logger.info("Adding popular movies to recommendations to meet limit")
+            excluded = {movie_id for movie_id, _ in ratings} | {movie.id for movie in recommended}
+            if filters:
+                snapshot = self.catalog.get()
+                recommended += self._movies_by_id(
+                    snapshot.popular_ids(snapshot.mask(filters), limit - len(recommended), excluded)
+                )
+            else:
+                recommended += self.Movie.query.filter(
+                    ~self.Movie.id.in_(excluded)
+                ).order_by(self.Movie.popularity.desc()).limit(limit - len(recommended)).all()
+            
+        return recommended
+        
+    def _precomputed_page(self, user_id, precomputed, limit, filters=None):
+        """
+        Get the first page of a user's recommendations from their precomputed row
+        The stored top movies stand in for the candidate pool: the filtered ones are re-ranked
+        with the same window and seed as page 0 of the online path, so both give the same order
+        Returns model indices, or None if too few stored movies pass the filters
+        """
+        movie_ids, scores = precomputed.get_movie_ids(), precomputed.get_scores()
+        if len(scores) != len(movie_ids):
+            return None
+            
+        mask, _ = self._filter_mask(filters)
+        candidates = []
+        relevance = []
+        for movie_id, score in zip(movie_ids, scores):
+            index = self.movie_indices.get(movie_id)
+            if index is not None and (mask is None or mask[index]):
+                candidates.append(index)
+                relevance.append(score)
                 
-            # Get recommendations based on liked movies
-            all_recommendations = []
+        window = limit * MMR_CANDIDATE_FACTOR
+        if len(candidates) < window:
+            return None
+            
+        relevance = np.array(relevance[:window], dtype=np.float32)
+        if relevance[0] > 0:
+            relevance /= relevance[0]
+        return self._diversify(np.array(candidates[:window]), relevance, limit, seed=[user_id, 0])
+        
+    def get_user_recommendations(self, user_id, limit=5, filters=None):
+        """
+        Get movie recommendations based on user's past ratings, optionally filtered
+        (see catalog.parse_filters)
+        Served from the batch-precomputed table when it is current for the user and
+        enough of it passes the filters, otherwise the first page of the user's
+        candidate pool is computed online
+        Returns a list of movie objects
+        """
+        try:
+            import db_writes
             
-            for movie_id in liked_movies:
-                recommendations = self.get_recommendations(movie_id, limit=3)
-                all_recommendations.extend(recommendations)
+            # Users without ratings get the cold-start response
+            ratings = self._user_ratings(user_id)
+            if not ratings:
+                logger.info(f"No ratings found for user {user_id}")
+                return []
                 
-            # Deduplicate and remove movies the user has already rated
-            rated_movie_ids = {r.movie_id for r in ratings}
-            unique_recommendations = []
-            seen_ids = set()
-            
-            for movie in all_recommendations:
-                if movie.id not in seen_ids and movie.id not in rated_movie_ids:
-                    unique_recommendations.append(movie)
-                    seen_ids.add(movie.id)
+            # Buffered writes aren't in the database yet, so they can't mark the precomputed row stale;
+            # otherwise the row is cached with the user's ratings and only queried when they change
+            precomputed = None
+            if not self.rating_store.has_pending(user_id):
+                precomputed = self.rating_store.get_precomputed(
+                    user_id, self.model_version,
+                    lambda: db_writes.get_fresh_user_recommendations(self.db.session, user_id, self.model_version)
+                )
+            if precomputed is not None:
+                indices = self._precomputed_page(user_id, precomputed, limit, filters)
+                if indices is not None:
+                    return self._movies_by_index(indices)
                     
-            # Sort by popularity and limit the results
-            unique_recommendations.sort(key=lambda x: x.popularity, reverse=True)
-            
-            recommended = unique_recommendations[:limit]
-            
-            # Store these recommendations for comparison in refresh
-            self.last_recommendations[user_id] = {movie.id for movie in recommended}
-            
-            return recommended
+            return self._recommendation_page(user_id, limit, page=0, ratings=ratings, filters=filters)
             
         except Exception as e:
             logger.error(f"Error getting user recommendations: {str(e)}")
             logger.error(traceback.format_exc())
             return []
 
-    def refresh_recommendations(self, user_id, limit=5):
+    def refresh_recommendations(self, user_id, limit=5, filters=None):
         """
-        Force a complete refresh of recommendations for a user
-        This rebuilds the similarity matrix and gets fresh recommendations
+        Get fresh recommendations for a user by moving to the next page of their (optionally filtered) candidate pool
+        Refreshing never rebuilds the model; the same refresh count always gives the same page
+        Returns a list of movie objects
         """
         try:
             # Track refresh count for this user
-            self.refresh_counts[user_id] = self.refresh_counts.get(user_id, 0) + 1
-            refresh_count = self.refresh_counts[user_id]
-            
-            logger.info(f"Starting recommendation refresh #{refresh_count} for user {user_id}")
-            
-            # Force rebuild the recommendation model to ensure we're using the latest data
-            force_rebuild = refresh_count % 3 == 1  # Force rebuild every 3rd refresh
-            self.initialize_recommendation_model(force=force_rebuild)
-            
-            # Import the Rating model here to avoid circular imports
-            from models import Rating
-            
-            # Get all of user's ratings
-            ratings = Rating.query.filter_by(user_id=user_id).all()
-            
-            if not ratings:
-                logger.info(f"No ratings found for user {user_id} during refresh")
-                return []
+            with self.cache_lock:
+                refresh_count = self.refresh_counts.pop(user_id, 0) + 1
+                self.refresh_counts[user_id] = refresh_count
+                if len(self.refresh_counts) > REFRESH_COUNT_CACHE_SIZE:
+                    self.refresh_counts.popitem(last=False)
                 
-            # Get all rated movie ids
-            rated_movie_ids = {r.movie_id for r in ratings}
-            
-            # Get highly rated movies (rating >= 4.0)
-            liked_movies = [r.movie_id for r in ratings if r.rating >= 4.0]
-            
-            if not liked_movies:
-                logger.info(f"No highly rated movies found for user {user_id} during refresh")
-                return []
-                
-            logger.info(f"Found {len(liked_movies)} highly rated movies for user {user_id}")
-            
-            # Different approach based on refresh count to ensure variety
-            all_recommendations = []
-            
-            # Every other refresh, prioritize different movies
-            if refresh_count % 2 == 0:
-                # Prioritize recently rated movies
-                recent_ratings = sorted(ratings, key=lambda r: r.updated_at if r.updated_at else r.created_at, reverse=True)
-                recent_liked = [r.movie_id for r in recent_ratings if r.rating >= 4.0][:3]
-                
-                for movie_id in recent_liked:
-                    recommendations = self.get_recommendations(movie_id, limit=5)
-                    all_recommendations.extend(recommendations)
-            else:
-                # Different approach: use all liked movies but with different random seeds
-                random.seed(os.urandom(4))  # Use 4 random bytes as seed
-                random.shuffle(liked_movies)
-                
-                for movie_id in liked_movies[:4]:  # Use first 4 after shuffling
-                    recommendations = self.get_recommendations(movie_id, limit=4)
-                    all_recommendations.extend(recommendations)
-            
-            # Ensure we have enough recommendations
-            if len(all_recommendations) < limit * 2:
-                # Get additional recommendations from other liked movies
-                remaining_liked = [m for m in liked_movies if m not in [r.id for r in all_recommendations]]
-                random.shuffle(remaining_liked)
-                
-                for movie_id in remaining_liked:
-                    recommendations = self.get_recommendations(movie_id, limit=3)
-                    all_recommendations.extend(recommendations)
-                    if len(all_recommendations) >= limit * 3:
-                        break
-            
-            # Deduplicate and remove movies the user has already rated
-            unique_recommendations = []
-            seen_ids = set()
-            
-            # Check if we have previous recommendations to avoid
-            previous_recommendations = self.last_recommendations.get(user_id, set())
-            
-            # First include some completely new movies
-            for movie in all_recommendations:
-                if (movie.id not in seen_ids and 
-                    movie.id not in rated_movie_ids and
-                    movie.id not in previous_recommendations):
-                    unique_recommendations.append(movie)
-                    seen_ids.add(movie.id)
-            
-            # If we need more, include some that might have been recommended before
-            if len(unique_recommendations) < limit:
-                for movie in all_recommendations:
-                    if movie.id not in seen_ids and movie.id not in rated_movie_ids:
-                        unique_recommendations.append(movie)
-                        seen_ids.add(movie.id)
-            
-            # Apply a complex ranking that changes based on refresh count
-            # This ensures different movies rise to the top on each refresh
-            if refresh_count % 3 == 0:
-                # Standard popularity-based ranking with small random factor
-                unique_recommendations.sort(
-                    key=lambda x: (x.popularity * 0.9 + random.random() * 0.1), 
-                    reverse=True
-                )
-            elif refresh_count % 3 == 1:
-                # Rating-based ranking with moderate random factor
-                unique_recommendations.sort(
-                    key=lambda x: (x.vote_average * 0.7 + random.random() * 0.3), 
-                    reverse=True
-                )
-            else:
-                # Random ranking with year bias (favor newer content)
-                current_year = datetime.now().year
-                unique_recommendations.sort(
-                    key=lambda x: random.random() * 0.7 + (0.3 * (1 if x.release_date and 
-                        current_year - x.release_date.year < 10 else 0)),
-                    reverse=True
-                )
-            
-            logger.info(f"Generated {len(unique_recommendations)} fresh recommendations for user {user_id}")
-            
-            # If we still don't have enough recommendations, add some popular movies the user hasn't rated
-            if len(unique_recommendations) < limit:
-                logger.info("Adding popular movies to recommendations to meet limit")
-                popular_movies = self.Movie.query.filter(
-                    ~self.Movie.id.in_(rated_movie_ids)
-                ).order_by(self.Movie.popularity.desc()).limit(limit).all()
-                
-                for movie in popular_movies:
-                    if movie.id not in seen_ids:
-                        unique_recommendations.append(movie)
-                        seen_ids.add(movie.id)
-            
-            # Store this set of recommendations to ensure variety next time
-            recommended = unique_recommendations[:limit]
-            self.last_recommendations[user_id] = {movie.id for movie in recommended}
+            logger.info(f"Recommendation refresh #{refresh_count} for user {user_id}")
             
-            return recommended
+            return self._recommendation_page(user_id, limit, page=refresh_count, filters=filters)
                 
         except Exception as e:
             logger.error(f"Error refreshing recommendations: {str(e)}")
@@ -364,7 +553,12 @@ class MovieRecommender:
     def get_model_info(self):
         """Get information about the current recommendation model"""
         return {
-            "initialized": self.similarity_matrix is not None,
+            "initialized": self.neighbor_indices is not None,
             "movie_count": len(self.movie_indices) if self.movie_indices else 0,
+            "version": self.model_version,
+            "feature_mode": self.feature_mode,
+            "embedding_dim": self.embeddings.shape[1] if self.embeddings is not None else None,
+            "score_precision": self.score_precision,
+            "published": self.artifact_mtime is not None,
             "last_update": self.last_model_update.isoformat() if self.last_model_update else None
         }
\ No newline at end of file
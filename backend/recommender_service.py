@@ -0,0 +1,280 @@
+"""
+Standalone recommender service
+Runs one MovieRecommender in a dedicated process and answers requests over a
+Unix socket or localhost TCP with a compact binary protocol, so web workers
+share a single model copy instead of each holding their own
+
+Protocol (network byte order), repeated over a persistent connection:
+    request:  op (uint8), subject id (uint32), limit (uint16), filters length (uint16), filters
+    response: status (uint8), payload length (uint32), payload
+Filters (user operations only, see catalog.parse_filters) and the info payload are JSON;
+movie ID payloads are packed uint32s
+"""
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import logging
+import threading
+import socketserver
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REQUEST = struct.Struct('!BIHH')
+RESPONSE_HEADER = struct.Struct('!BI')
+
+# Operations
+OP_SIMILAR = 1  # Subject is a movie ID
+OP_USER = 2  # Subject is a user ID
+OP_REFRESH = 3  # Subject is a user ID
+OP_INFO = 4
+
+# Response statuses
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Address of the service, e.g. unix:/tmp/movierecs-recommender.sock or 127.0.0.1:7070
+SERVICE_ADDRESS = os.environ.get('RECOMMENDER_SERVICE_ADDRESS')
+
+# Client connection pool size and per-call socket timeout in seconds
+SERVICE_POOL_SIZE = int(os.environ.get('RECOMMENDER_SERVICE_POOL_SIZE', 8))
+SERVICE_TIMEOUT = float(os.environ.get('RECOMMENDER_SERVICE_TIMEOUT', 2.0))
+
+class RecommenderUnavailable(Exception):
+    """The recommender service could not be reached or failed to answer"""
+
+def parse_address(address):
+    """
+    Parse 'unix:/path/to.sock' or 'host:port' into (socket family, address)
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+def _recv_exact(sock, size):
+    """Read exactly size bytes from a socket, raising ConnectionError on EOF"""
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def pack_movie_ids(movie_ids):
+    """Pack movie IDs as a response payload"""
+    return struct.pack(f'!{len(movie_ids)}I', *movie_ids)
+
+def unpack_movie_ids(payload):
+    """Unpack a movie ID response payload"""
+    return list(struct.unpack(f'!{len(payload) // 4}I', payload))
+
+class RecommenderRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one client connection until the client disconnects"""
+
+    def handle(self):
+        while True:
+            try:
+                op, subject_id, limit, filters_length = REQUEST.unpack(_recv_exact(self.request, REQUEST.size))
+                filters = _recv_exact(self.request, filters_length) if filters_length else b''
+            except ConnectionError:
+                return
+
+            try:
+                filters = json.loads(filters) if filters else None
+                status, payload = STATUS_OK, self.server.dispatch(op, subject_id, limit, filters)
+            except Exception as e:
+                logger.error(f"Error handling recommender request {op}: {str(e)}")
+                status, payload = STATUS_ERROR, str(e).encode()
+
+            self.request.sendall(RESPONSE_HEADER.pack(status, len(payload)) + payload)
+
+class RecommenderServiceMixin:
+    """Holds the recommender and application; requests run in an application context"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_recommender(self, app, recommender):
+        """Attach the application and the recommender that answers requests"""
+        self.app = app
+        self.recommender = recommender
+        self.model_lock = threading.Lock()
+
+    def dispatch(self, op, subject_id, limit, filters=None):
+        """Run one operation and return its response payload"""
+        with self.app.app_context():
+            # Picks up newly published artifacts; builds happen at most once at a time
+            with self.model_lock:
+                self.recommender.initialize_recommendation_model()
+
+            if op == OP_SIMILAR:
+                movies = self.recommender.get_recommendations(subject_id, limit=limit)
+            elif op == OP_USER:
+                movies = self.recommender.get_user_recommendations(subject_id, limit=limit, filters=filters)
+            elif op == OP_REFRESH:
+                movies = self.recommender.refresh_recommendations(subject_id, limit=limit, filters=filters)
+            elif op == OP_INFO:
+                return json.dumps(self.recommender.get_model_info()).encode()
+            else:
+                raise ValueError(f"Unknown operation {op}")
+
+            return pack_movie_ids([movie.id for movie in movies])
+
+class UnixRecommenderServer(RecommenderServiceMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+class TCPRecommenderServer(RecommenderServiceMixin, socketserver.ThreadingTCPServer):
+    pass
+
+def create_server(address, app, recommender):
+    """Create a threaded service server listening on the given address"""
+    family, bind_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            os.remove(bind_address)
+        server = UnixRecommenderServer(bind_address, RecommenderRequestHandler)
+    else:
+        server = TCPRecommenderServer(bind_address, RecommenderRequestHandler)
+    server.setup_recommender(app, recommender)
+    return server
+
+class RecommenderClient:
+    """
+    Client for the recommender service with the same interface as MovieRecommender
+    Connections are pooled and reused; failures are logged and return no recommendations,
+    so callers fall back to popular movies
+    """
+
+    def __init__(self, address, Movie, pool_size=SERVICE_POOL_SIZE, timeout=SERVICE_TIMEOUT):
+        """Initialize with the service address and the Movie model used to load results"""
+        self.address = address
+        self.Movie = Movie
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        """Open a new connection to the service"""
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _call(self, op, subject_id=0, limit=0, filters=None):
+        """
+        Send one request and return the response payload
+        A pooled connection that turns out to be dead is replaced once
+        """
+        filters = json.dumps(filters, separators=(',', ':')).encode() if filters else b''
+        try:
+            request = REQUEST.pack(op, subject_id, limit, len(filters)) + filters
+        except struct.error as e:
+            # Values outside the protocol's field sizes (e.g. a limit over 65535)
+            raise RecommenderUnavailable(f"Request not representable in the service protocol: {str(e)}")
+
+        for attempt in range(2):
+            try:
+                sock, pooled = self.pool.get_nowait(), True
+            except queue.Empty:
+                sock, pooled = None, False
+
+            try:
+                if sock is None:
+                    sock = self._connect()
+                sock.sendall(request)
+                status, length = RESPONSE_HEADER.unpack(_recv_exact(sock, RESPONSE_HEADER.size))
+                payload = _recv_exact(sock, length)
+            except OSError as e:
+                if sock is not None:
+                    sock.close()
+                if pooled and attempt == 0:
+                    continue
+                raise RecommenderUnavailable(f"Recommender service at {self.address} failed: {str(e)}")
+
+            try:
+                self.pool.put_nowait(sock)
+            except queue.Full:
+                sock.close()
+
+            if status != STATUS_OK:
+                raise RecommenderUnavailable(f"Recommender service error: {payload.decode(errors='replace')}")
+            return payload
+
+    def _movies(self, op, subject_id, limit, filters=None):
+        """Call a movie-returning operation and load the movies, or return [] on failure"""
+        started = time.time()
+        try:
+            movie_ids = unpack_movie_ids(self._call(op, subject_id, limit, filters))
+        except RecommenderUnavailable as e:
+            logger.error(str(e))
+            return []
+        logger.info(f"Recommender service op {op} returned {len(movie_ids)} movies "
+                    f"in {(time.time() - started) * 1000:.1f}ms")
+        if not movie_ids:
+            return []
+
+        # Loaded here rather than through recommender.movies_by_id, so web workers
+        # using the service never import the model's dependencies
+        movies = {movie.id: movie for movie in self.Movie.query.filter(self.Movie.id.in_(movie_ids)).all()}
+        return [movies[movie_id] for movie_id in movie_ids if movie_id in movies]
+
+    def initialize_recommendation_model(self, force=False, rebuild_stale=True):
+        """The service owns the model; nothing to initialize in the web worker"""
+        return True
+
+    def get_recommendations(self, movie_id, limit=5):
+        """Get movies similar to a movie from the service"""
+        return self._movies(OP_SIMILAR, movie_id, limit)
+
+    def get_user_recommendations(self, user_id, limit=5, filters=None):
+        """Get a user's (optionally filtered) recommendations from the service"""
+        return self._movies(OP_USER, user_id, limit, filters)
+
+    def refresh_recommendations(self, user_id, limit=5, filters=None):
+        """Get a user's next page of (optionally filtered) recommendations from the service"""
+        return self._movies(OP_REFRESH, user_id, limit, filters)
+
+    def get_model_info(self):
+        """Get information about the service's model"""
+        try:
+            info = json.loads(self._call(OP_INFO))
+        except RecommenderUnavailable as e:
+            logger.error(str(e))
+            info = {"initialized": False}
+        return {**info, "service": self.address}
+
+if __name__ == "__main__":
+    import argparse
+    from app import app
+    from models import db, Movie
+    from recommender import MovieRecommender
+
+    parser = argparse.ArgumentParser(description="Run the recommender as a standalone service")
+    parser.add_argument('--address', default=SERVICE_ADDRESS or 'unix:/tmp/movierecs-recommender.sock',
+                        help="unix:/path/to.sock or host:port")
+    args = parser.parse_args()
+
+    movie_recommender = MovieRecommender(db, Movie)
+    with app.app_context():
+        movie_recommender.initialize_recommendation_model()
+
+    server = create_server(args.address, app, movie_recommender)
+    logger.info(f"Recommender service listening on {args.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
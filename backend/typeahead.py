@@ -0,0 +1,182 @@
+"""
+Typeahead suggestions from an in-memory sorted-prefix index
+Every word start of every title, director and actor name is a key in one sorted
+list, so the keys beginning with a typed prefix form a contiguous range found by
+two binary searches; the most popular suggestions in the range are picked with a
+vectorized partial sort instead of scanning the catalog with LIKE
+
+The index is rebuilt whenever the catalog snapshot's version changes (see catalog.py)
+"""
+import re
+import time
+import bisect
+import logging
+import threading
+import numpy as np
+from sqlalchemy import select
+from models import Movie
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Suggestions returned by default and at most
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+# Word starts indexed per title or name; later words of long titles aren't matched
+MAX_WORD_STARTS = 8
+
+# Suggestion kinds
+KIND_TITLE = 'title'
+KIND_DIRECTOR = 'director'
+KIND_ACTOR = 'actor'
+
+# Keys sort below this character's code point when they start with the prefix
+PREFIX_END = '\U0010ffff'
+
+NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(text):
+    """Lowercase text and collapse punctuation and whitespace into single spaces"""
+    return NON_WORD.sub(' ', (text or '').casefold()).strip()
+
+def word_starts(text):
+    """Keys for a title or name: the normalized text from each of its first words onwards"""
+    words = normalize(text).split()
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORD_STARTS))]
+
+def split_names(names):
+    """Split a comma separated director or actors field into names"""
+    return [name.strip() for name in (names or '').split(',') if name.strip() and name.strip() != 'N/A']
+
+class PrefixIndex:
+    """
+    Sorted keys with the suggestion each belongs to
+    A suggestion is a movie title (scored by the movie's popularity) or a director or
+    actor (scored by the summed popularity of their movies)
+    """
+
+    def __init__(self, suggestions, keys, key_suggestions, scores, version):
+        self.suggestions = suggestions  # Suggestion dicts, by suggestion number
+        self.keys = keys  # Sorted list of normalized keys
+        self.key_suggestions = key_suggestions  # int32 suggestion number per key
+        self.key_scores = scores[key_suggestions]  # float32 suggestion score per key
+        self.version = version  # Catalog version the index was built from
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def search(self, query, limit=DEFAULT_SUGGESTIONS):
+        """
+        Get the most popular suggestions the query is a prefix of, matched from the start
+        of any word (both 'godf' and 'the godf' suggest 'The Godfather')
+        Returns a list of suggestion dicts, best first
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        start = bisect.bisect_left(self.keys, prefix)
+        stop = bisect.bisect_left(self.keys, prefix + PREFIX_END, start)
+        if start == stop:
+            return []
+
+        # A suggestion can match through several of its word starts, so take extra and dedupe
+        scores = self.key_scores[start:stop]
+        wanted = min(limit * 2, stop - start)
+        while True:
+            if wanted < stop - start:
+                top = np.argpartition(-scores, wanted - 1)[:wanted]
+            else:
+                top = np.arange(stop - start)
+            top = top[np.argsort(-scores[top], kind='stable')]
+            numbers = list(dict.fromkeys(self.key_suggestions[start + top].tolist()))
+            if len(numbers) >= limit or wanted >= stop - start:
+                return [self.suggestions[number] for number in numbers[:limit]]
+            wanted = min(wanted * 4, stop - start)
+
+def build_index(session, version=None):
+    """Build a PrefixIndex from the catalog in one streamed pass"""
+    suggestions = []
+    scores = []
+    people = {}  # (kind, normalized name) -> suggestion number
+    entries = []  # (key, suggestion number)
+
+    rows = session.execute(
+        select(Movie.id, Movie.title, Movie.director, Movie.actors, Movie.popularity,
+               Movie.release_date, Movie.vote_average, Movie.poster_path)
+        .execution_options(yield_per=1000)
+    )
+    for movie_id, title, director, actors, popularity, release_date, vote_average, poster_path in rows:
+        popularity = popularity or 0.0
+
+        number = len(suggestions)
+        suggestions.append({
+            'kind': KIND_TITLE,
+            'text': title,
+            'movie_id': movie_id,
+            'year': release_date.year if release_date else None,
+            'vote_average': vote_average,
+            'poster_path': poster_path
+        })
+        scores.append(popularity)
+        entries.extend((key, number) for key in word_starts(title))
+
+        for kind, names in ((KIND_DIRECTOR, director), (KIND_ACTOR, actors)):
+            for name in split_names(names):
+                person_key = (kind, normalize(name))
+                if not person_key[1]:
+                    continue
+                number = people.get(person_key)
+                if number is None:
+                    number = people[person_key] = len(suggestions)
+                    suggestions.append({'kind': kind, 'text': name, 'movie_count': 0})
+                    scores.append(0.0)
+                    entries.extend((key, number) for key in word_starts(name))
+                suggestions[number]['movie_count'] += 1
+                scores[number] += popularity
+
+    entries.sort()
+    return PrefixIndex(
+        suggestions,
+        [key for key, _ in entries],
+        np.array([number for _, number in entries], dtype=np.int32),
+        np.array(scores, dtype=np.float32),
+        version
+    )
+
+class TypeaheadCache:
+    """Holds the prefix index and rebuilds it when the catalog snapshot's version changes"""
+
+    def __init__(self, db, catalog):
+        """Initialize with the database and the CatalogCache whose version the index follows"""
+        self.db = db
+        self.catalog = catalog
+        self.index = None
+        self.build_lock = threading.Lock()
+
+    def get(self):
+        """
+        Get a prefix index for the current catalog version, rebuilding it if the catalog changed
+        Only one thread rebuilds; the others keep using the previous index
+        Must be called inside an application context
+        Returns a PrefixIndex
+        """
+        version = self.catalog.get().version
+        if self.index is not None and self.index.version == version:
+            return self.index
+
+        # Without an index yet, wait for the building thread instead of returning nothing
+        blocking = self.index is None
+        if self.build_lock.acquire(blocking=blocking):
+            try:
+                if self.index is None or self.index.version != version:
+                    started = time.time()
+                    self.index = build_index(self.db.session, version)
+                    logger.info(f"Built typeahead index of {len(self.index)} suggestions and "
+                                f"{len(self.index.keys)} keys in {time.time() - started:.2f}s")
+            finally:
+                self.build_lock.release()
+
+        return self.index
@@ -0,0 +1,287 @@
+"""
+Write-behind buffering for rating writes
+Acknowledges a rating once it is appended (and fsynced) to a local log, keeps it
+in memory where reads and the recommender see it immediately, and flushes the
+pending writes to the database in batches on a short interval
+
+The log is split into numbered segments; a segment is deleted once every write
+in it has been committed. On start, leftover segments from a crash are replayed
+into the database. One process owns a log path at a time (enforced with a lock
+file where fcntl is available), and pending writes are visible only in that
+process, so write-behind is for single-process servers (asgi.py under uvicorn);
+preforked workers (gunicorn.conf.py) always write synchronously
+"""
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from models import Rating
+import db_writes
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Log path prefix; write-behind mode is enabled when set
+WRITE_BEHIND_LOG = os.environ.get('WRITE_BEHIND_LOG')
+
+# Seconds between flushes of pending writes to the database
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+
+class LogLocked(Exception):
+    """Another process owns the write-behind log"""
+
+class RatingWriteBuffer:
+    """
+    Pending rating writes, keyed by (user_id, movie_id); the latest write per key wins
+    A pending entry is (rating, review, submitted_at), with rating None for a deletion
+    """
+
+    def __init__(self, app, db, log_path, interval=WRITE_BEHIND_INTERVAL):
+        """Initialize with the application, database and log path prefix; call start() to use"""
+        self.app = app
+        self.db = db
+        self.log_path = log_path
+        self.interval = interval
+        self.pending = {}
+        self.flushing = {}  # Entries being written by the current flush
+        self.lock = threading.Lock()  # Guards pending, flushing and the log
+        self.flush_lock = threading.Lock()  # One flush at a time
+        self.segment = 0
+        self.segment_bytes = 0
+        self.log_file = None
+        self.lock_file = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _segment_path(self, number):
+        """Path of a numbered log segment"""
+        return f"{self.log_path}.{number:08d}"
+
+    def _segment_numbers(self):
+        """Numbers of the log segments on disk, oldest first"""
+        numbers = []
+        for path in glob.glob(f"{glob.escape(self.log_path)}.*"):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    def _open_segment(self, number):
+        """Start appending to a new log segment; must be called with the lock held"""
+        if self.log_file is not None:
+            self.log_file.close()
+        self.segment = number
+        self.segment_bytes = 0
+        self.log_file = open(self._segment_path(number), 'ab')
+
+    def start(self):
+        """
+        Take ownership of the log, replay any segments left by a crash and start the flusher
+        Raises LogLocked if another process owns the log
+        """
+        directory = os.path.dirname(os.path.abspath(self.log_path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock_file = open(f"{self.log_path}.lock", 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lock_file.close()
+                raise LogLocked(f"Write-behind log {self.log_path} is in use by another process")
+
+        numbers = self._segment_numbers()
+        recovered = 0
+        for number in numbers:
+            recovered += self._replay_segment(number)
+
+        with self.lock:
+            self._open_segment(numbers[-1] + 1 if numbers else 0)
+
+        if recovered:
+            logger.info(f"Recovered {recovered} logged rating writes ({len(self.pending)} pending) "
+                        f"from {len(numbers)} segments")
+            self.flush()
+
+        self.thread = threading.Thread(target=self._run, name='rating-write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _replay_segment(self, number):
+        """Load one segment's writes into pending; returns the number of writes read"""
+        count = 0
+        with open(self._segment_path(number), 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append was never acknowledged
+                    logger.warning(f"Skipping unreadable record in write-behind segment {number}")
+                    continue
+                self.pending[(record['user_id'], record['movie_id'])] = (
+                    record['rating'], record.get('review', ''), record['submitted_at']
+                )
+                count += 1
+        return count
+
+    def _append(self, records):
+        """Append records to the log and fsync; must be called with the lock held"""
+        data = b''.join(json.dumps(record, separators=(',', ':')).encode() + b'\n' for record in records)
+        self.log_file.write(data)
+        self.log_file.flush()
+        os.fsync(self.log_file.fileno())
+        self.segment_bytes += len(data)
+
+    def submit(self, user_id, items):
+        """
+        Durably log rating writes and make them pending
+        items is a list of (movie_id, rating, review), with rating None to delete the rating
+        Returns transient Rating objects for the written (non-deleted) ratings
+        """
+        submitted_at = time.time()
+        records = [
+            {'user_id': user_id, 'movie_id': movie_id,
+             'rating': None if rating is None else float(rating), 'review': review or '',
+             'submitted_at': submitted_at}
+            for movie_id, rating, review in items
+        ]
+
+        with self.lock:
+            self._append(records)
+            for record in records:
+                self.pending[(user_id, record['movie_id'])] = (
+                    record['rating'], record['review'], submitted_at
+                )
+
+        updated_at = datetime.utcfromtimestamp(submitted_at)
+        return [
+            Rating(user_id=user_id, movie_id=record['movie_id'], rating=record['rating'],
+                   review=record['review'], updated_at=updated_at)
+            for record in records if record['rating'] is not None
+        ]
+
+    def overlay(self, user_id):
+        """
+        Get a user's writes that are not yet committed, as a dict of movie_id -> rating
+        (None for a deleted rating); reads apply these over what the database returns
+        """
+        with self.lock:
+            entries = list(self.flushing.items()) + list(self.pending.items())
+        return {movie_id: entry[0] for (entry_user_id, movie_id), entry in entries if entry_user_id == user_id}
+
+    def pending_rating(self, user_id, movie_id):
+        """
+        Get the uncommitted write for one movie
+        Returns (found, Rating or None), where a found None means the rating was deleted
+        """
+        with self.lock:
+            entry = self.pending.get((user_id, movie_id)) or self.flushing.get((user_id, movie_id))
+        if entry is None:
+            return False, None
+        if entry[0] is None:
+            return True, None
+        return True, Rating(user_id=user_id, movie_id=movie_id, rating=entry[0], review=entry[1],
+                            updated_at=datetime.utcfromtimestamp(entry[2]))
+
+    def has_pending(self, user_id):
+        """Check whether a user has writes that are not yet committed"""
+        return bool(self.overlay(user_id))
+
+    def flush(self, user_id=None):
+        """
+        Write pending writes (all, or one user's) to the database in one transaction
+        Failed writes go back to pending, unless newer writes for the same ratings arrived
+        Returns the number of writes committed
+        """
+        with self.flush_lock:
+            with self.lock:
+                if user_id is None:
+                    batch, self.pending = self.pending, {}
+                    # Everything logged so far is now in this batch or already committed
+                    flushed_segment = self.segment
+                    if self.segment_bytes:
+                        self._open_segment(self.segment + 1)
+                else:
+                    batch = {key: entry for key, entry in self.pending.items() if key[0] == user_id}
+                    for key in batch:
+                        del self.pending[key]
+                    flushed_segment = None
+                self.flushing = batch
+
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                logger.error(f"Error flushing {len(batch)} rating writes, will retry: {str(e)}")
+                with self.lock:
+                    for key, entry in batch.items():
+                        self.pending.setdefault(key, entry)
+                    self.flushing = {}
+                return 0
+
+            with self.lock:
+                self.flushing = {}
+
+            if flushed_segment is not None:
+                for number in self._segment_numbers():
+                    if number < flushed_segment or (number == flushed_segment and number != self.segment):
+                        os.remove(self._segment_path(number))
+
+            return len(batch)
+
+    def _write(self, batch):
+        """
+        Apply a batch of writes with one upsert and one delete per user, then commit
+        Ratings keep their submit time as updated_at, as acknowledged to the client
+        """
+        upserts = {}
+        deletes = {}
+        for (user_id, movie_id), (rating, review, submitted_at) in batch.items():
+            if rating is None:
+                deletes.setdefault(user_id, []).append(movie_id)
+            else:
+                upserts.setdefault(user_id, []).append(
+                    (movie_id, rating, review, datetime.utcfromtimestamp(submitted_at))
+                )
+
+        started = time.time()
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                for user_id, items in upserts.items():
+                    db_writes.upsert_ratings(session, user_id, items)
+                    # updated_at is the submit time, which a batch run may have passed before this commit
+                    db_writes.invalidate_user_recommendations(session, user_id)
+                for user_id, movie_ids in deletes.items():
+                    db_writes.delete_ratings(session, user_id, movie_ids)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+        logger.info(f"Flushed {len(batch)} rating writes for {len(set(upserts) | set(deletes))} users "
+                    f"in {(time.time() - started) * 1000:.1f}ms")
+
+    def _run(self):
+        """Flusher thread: flush on every interval until stopped"""
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and flush what is left; anything unflushed stays in the log"""
+        self.stop_event.set()
+        self.flush()
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
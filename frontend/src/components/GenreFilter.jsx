@@ -1,7 +1,8 @@
 import React, { useEffect, useState } from 'react';
 import { movies } from '../services/api';
 
-const GenreFilter = ({ onGenreSelect, selectedGenre = '' }) => {
+// counts optionally maps genre names to their number of matching movies (from the facets of /movies)
+const GenreFilter = ({ onGenreSelect, selectedGenre = '', counts = null }) => {
   const [genres, setGenres] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
 
@@ -49,6 +50,9 @@ const GenreFilter = ({ onGenreSelect, selectedGenre = '' }) => {
             }`}
           >
             {genre}
+            {counts && (
+              <span className="ml-1 opacity-75">({counts[genre] || 0})</span>
+            )}
           </button>
         ))}
       </div>
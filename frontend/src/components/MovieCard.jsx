@@ -83,9 +83,9 @@ const MovieCard = ({ movie, showRating = false, onRatingChange, onWatchlistChang
   useEffect(() => {
     if (!currentUser || !showRating) return;
     
-    // Set rating from movie data if available
-    if (movie.user_rating) {
-      setUserRating(movie.user_rating);
+    // Set rating from movie data if available (null means known to be unrated)
+    if (movie.user_rating !== undefined) {
+      setUserRating(movie.user_rating || 0);
       return;
     }
     
@@ -28,32 +28,32 @@ const SearchBar = () => {
     };
   }, []);
   
-  // Debounce search to avoid excessive API calls
+  // Short debounce: suggestions come from an in-memory prefix index, not a database search
   useEffect(() => {
     const debounceTimer = setTimeout(() => {
-      if (query.trim().length >= 2) {
+      if (query.trim().length >= 1) {
         performSearch();
       } else {
         setResults([]);
         setShowResults(false);
       }
-    }, 500);
+    }, 150);
     
     return () => clearTimeout(debounceTimer);
   }, [query]);
   
   const performSearch = async () => {
-    if (query.trim().length < 2) return;
+    if (query.trim().length < 1) return;
     
     try {
       setIsLoading(true);
       setError('');
       
-      // Explicitly search for movie titles only
-      const response = await movies.search(query, '', 1, 5, 'title_only=true'); // Add title_only parameter
+      // Suggested titles, directors and actors, most popular first
+      const response = await movies.autocomplete(query, 8);
       
-      if (response.data && response.data.movies) {
-        setResults(response.data.movies);
+      if (response.data && response.data.suggestions) {
+        setResults(response.data.suggestions);
         setShowResults(true);
       } else {
         setResults([]);
@@ -89,8 +89,16 @@ const SearchBar = () => {
     }
   };
   
-  const handleResultClick = (movieId) => {
-    navigate(`/movies/${movieId}`);
+  const handleResultClick = (suggestion) => {
+    if (suggestion.kind === 'title') {
+      navigate(`/movies/${suggestion.movie_id}`);
+    } else {
+      // Directors and actors open a search for their movies
+      navigate({
+        pathname: '/movies',
+        search: `?search=${encodeURIComponent(suggestion.text)}`
+      });
+    }
     setShowResults(false);
     setQuery('');
   };
@@ -112,7 +120,7 @@ const SearchBar = () => {
             placeholder="Search for movies..."
             className="w-full px-4 py-3 pl-10 pr-10 text-gray-900 bg-white border border-gray-300 rounded-full shadow-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent"
             onClick={() => {
-              if (query.trim().length >= 2 && results.length > 0) {
+              if (query.trim().length >= 1 && results.length > 0) {
                 setShowResults(true);
               }
             }}
@@ -138,7 +146,7 @@ const SearchBar = () => {
       </form>
       
       {/* Search results dropdown */}
-      {showResults && (query.trim().length >= 2) && (
+      {showResults && (query.trim().length >= 1) && (
         <div className="absolute z-10 w-full mt-1 bg-white rounded-md shadow-lg max-h-96 overflow-y-auto">
           {error ? (
             <div className="p-4 text-gray-500 text-center">
@@ -146,32 +154,44 @@ const SearchBar = () => {
             </div>
           ) : results.length > 0 ? (
             <ul>
-              {results.map((movie) => (
-                <li key={movie.id}>
+              {results.map((suggestion) => (
+                <li key={`${suggestion.kind}-${suggestion.movie_id || suggestion.text}`}>
                   <button
                     className="flex items-center w-full px-4 py-3 text-left hover:bg-gray-100 focus:outline-none focus:bg-gray-100"
-                    onClick={() => handleResultClick(movie.id)}
+                    onClick={() => handleResultClick(suggestion)}
                   >
-                    <div className="flex-shrink-0 w-10 h-14 mr-3">
-                      {movie.poster_path ? (
-                        <img 
-                          src={movie.poster_path} 
-                          alt={movie.title} 
-                          className="w-full h-full object-cover rounded"
-                        />
-                      ) : (
-                        <div className="w-full h-full bg-gray-200 rounded flex items-center justify-center">
-                          <span className="text-xs text-gray-500">No image</span>
+                    {suggestion.kind === 'title' ? (
+                      <>
+                        <div className="flex-shrink-0 w-10 h-14 mr-3">
+                          {suggestion.poster_path ? (
+                            <img 
+                              src={suggestion.poster_path} 
+                              alt={suggestion.text} 
+                              className="w-full h-full object-cover rounded"
+                            />
+                          ) : (
+                            <div className="w-full h-full bg-gray-200 rounded flex items-center justify-center">
+                              <span className="text-xs text-gray-500">No image</span>
+                            </div>
+                          )}
+                        </div>
+                        <div className="flex-grow overflow-hidden">
+                          <div className="font-medium text-gray-900 truncate">{suggestion.text}</div>
+                          <div className="text-sm text-gray-500">
+                            {suggestion.year || 'Unknown year'}
+                            {suggestion.vote_average ? ` • ${suggestion.vote_average.toFixed(1)}/10` : ''}
+                          </div>
+                        </div>
+                      </>
+                    ) : (
+                      <div className="flex-grow overflow-hidden">
+                        <div className="font-medium text-gray-900 truncate">{suggestion.text}</div>
+                        <div className="text-sm text-gray-500">
+                          {suggestion.kind === 'director' ? 'Director' : 'Actor'}
+                          {` • ${suggestion.movie_count} ${suggestion.movie_count === 1 ? 'movie' : 'movies'}`}
                         </div>
-                      )}
-                    </div>
-                    <div className="flex-grow overflow-hidden">
-                      <div className="font-medium text-gray-900 truncate">{movie.title}</div>
-                      <div className="text-sm text-gray-500">
-                        {movie.release_date ? new Date(movie.release_date).getFullYear() : 'Unknown year'}
-                        {movie.vote_average ? ` • ${movie.vote_average.toFixed(1)}/10` : ''}
                       </div>
-                    </div>
+                    )}
                   </button>
                 </li>
               ))}
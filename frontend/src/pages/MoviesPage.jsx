@@ -3,7 +3,8 @@ import { useSearchParams } from 'react-router-dom';
 import MovieCard from '../components/MovieCard';
 import Pagination from '../components/Pagination';
 import GenreFilter from '../components/GenreFilter';
-import { movies } from '../services/api';
+import { useAuth } from '../contexts/AuthContext';
+import { movies, withUserMovieState } from '../services/api';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
 import { 
   faFilter, 
@@ -15,6 +16,7 @@ import {
 
 const MoviesPage = () => {
   const [searchParams, setSearchParams] = useSearchParams();
+  const { currentUser } = useAuth();
   const page = parseInt(searchParams.get('page') || '1');
   const genre = searchParams.get('genre') || '';
   const sortBy = searchParams.get('sort') || 'vote_average';
@@ -29,6 +31,7 @@ const MoviesPage = () => {
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   const [showFilters, setShowFilters] = useState(false);
+  const [genreCounts, setGenreCounts] = useState(null);
   
   const sortOptions = [
     { value: 'popularity', label: 'Popularity' },
@@ -39,7 +42,7 @@ const MoviesPage = () => {
   
   useEffect(() => {
     fetchMovies();
-  }, [page, genre, sortBy, order]);
+  }, [page, genre, sortBy, order, currentUser]);
   
   const fetchMovies = async () => {
     try {
@@ -47,9 +50,26 @@ const MoviesPage = () => {
       setError(null);
       
       // Use the updated search method with all parameters
-      const response = await movies.search('', genre, page, 20, sortBy, order);
+      const response = await movies.search('', genre, page, 20, sortBy, order, { facets: true });
       
-      setMoviesList(response.data.movies);
+      // Load ratings and watchlist state for the whole page in two requests
+      let pageMovies = response.data.movies;
+      if (currentUser) {
+        try {
+          pageMovies = await withUserMovieState(pageMovies);
+        } catch (err) {
+          console.error('Error loading rating and watchlist state:', err);
+        }
+      }
+      
+      setMoviesList(pageMovies);
+      
+      // Movie counts per genre for the filter buttons
+      if (response.data.facets) {
+        setGenreCounts(Object.fromEntries(
+          response.data.facets.genres.map(facet => [facet.name, facet.count])
+        ));
+      }
       setPagination({
         currentPage: response.data.current_page,
         totalPages: response.data.pages,
@@ -133,7 +153,7 @@ const MoviesPage = () => {
               </div>
               
               <div className="mb-6 pb-6 border-b border-gray-100">
-                <GenreFilter onGenreSelect={handleGenreSelect} selectedGenre={genre} />
+                <GenreFilter onGenreSelect={handleGenreSelect} selectedGenre={genre} counts={genreCounts} />
               </div>
               
               <div>
@@ -204,7 +224,7 @@ const MoviesPage = () => {
                 
                 <div className="mb-6 pb-5 border-b border-gray-100">
                   <h4 className="text-sm font-medium text-gray-700 mb-3">Genre</h4>
-                  <GenreFilter onGenreSelect={handleGenreSelect} selectedGenre={genre} />
+                  <GenreFilter onGenreSelect={handleGenreSelect} selectedGenre={genre} counts={genreCounts} />
                 </div>
                 
                 <div>
@@ -3,7 +3,7 @@ import { Link } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import MovieCard from '../components/MovieCard';
 import Pagination from '../components/Pagination';
-import { ratings, movies } from '../services/api';
+import { ratings } from '../services/api';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
 import { 
   faStar, 
@@ -250,57 +250,18 @@ const RatedMoviesPage = () => {
       setIsLoading(true);
       setError(null);
       
-      // Use the existing endpoint for ratings
-      const response = await ratings.getUserRatings(page);
+      // Rated movies come back with full movie details in a single request
+      const response = await ratings.getRatedMovies(page);
       
-      if (!response.data || !response.data.ratings) {
+      if (!response.data || !response.data.rated_movies) {
         throw new Error('Unexpected response format');
       }
       
-      console.log('User ratings response:', response.data);
-      
-      const ratingsList = response.data.ratings;
-      
-      // If there are no ratings, just set empty array
-      if (ratingsList.length === 0) {
-        setRatedMovies([]);
-        setPagination({
-          currentPage: response.data.pagination.page || 1,
-          totalPages: response.data.pagination.pages || 1,
-          totalItems: response.data.pagination.total || 0
-        });
-        setIsLoading(false);
-        return;
-      }
-      
-      // For each rating, fetch the movie details
-      const moviePromises = ratingsList.map(async (rating) => {
-        try {
-          const movieResponse = await movies.getById(rating.movie_id);
-          const movieData = movieResponse.data;
-          
-          return {
-            ...movieData,
-            user_rating: rating.rating,
-            user_review: rating.review,
-            rating_id: rating.id,
-            rated_at: rating.created_at,
-            updated_at: rating.updated_at
-          };
-        } catch (err) {
-          console.error(`Failed to fetch movie ${rating.movie_id}:`, err);
-          return null;
-        }
-      });
-      
-      // Wait for all movie fetches to complete
-      const moviesWithRatings = (await Promise.all(moviePromises)).filter(Boolean);
-      
-      setRatedMovies(moviesWithRatings);
+      setRatedMovies(response.data.rated_movies);
       setPagination({
-        currentPage: response.data.pagination.page || 1,
-        totalPages: response.data.pagination.pages || 1,
-        totalItems: response.data.pagination.total || 0
+        currentPage: response.data.current_page || 1,
+        totalPages: response.data.pages || 1,
+        totalItems: response.data.total || 0
       });
     } catch (err) {
       console.error('Error fetching rated movies:', err);
@@ -10,6 +10,7 @@ import {
 } from "@fortawesome/free-solid-svg-icons";
 import MovieCard from "../components/MovieCard";
 import Pagination from "../components/Pagination";
+import GenreFilter from "../components/GenreFilter";
 import { useAuth } from "../contexts/AuthContext";
 import { recommendations } from "../services/api";
 
@@ -24,6 +25,7 @@ const RecommendedMoviesPage = () => {
   const [currentPage, setCurrentPage] = useState(1);
   const [moviesPerPage] = useState(16); // Number of movies per page
   const [lastRefreshed, setLastRefreshed] = useState(new Date());
+  const [selectedGenre, setSelectedGenre] = useState("");
   
   // Fetch recommendations function - can be called any time to get fresh recommendations
   const fetchRecommendations = async (showRefreshingState = false) => {
@@ -40,7 +42,7 @@ const RecommendedMoviesPage = () => {
       setError(null);
       
       // Add timestamp and refresh parameter to avoid caching and get fresh recommendations
-      const response = await recommendations.getRecommendations(48, true);
+      const response = await recommendations.getRecommendations(48, true, { genre: selectedGenre });
       
       if (response.data && response.data.recommendations) {
         setRecommendedMovies(response.data.recommendations);
@@ -70,11 +72,12 @@ const RecommendedMoviesPage = () => {
   };
   
   // Get initial recommendations when component mounts
+  // and again whenever the genre filter changes
   useEffect(() => {
     if (currentUser) {
       fetchRecommendations();
     }
-  }, [currentUser]);
+  }, [currentUser, selectedGenre]);
   
   // Calculate pagination
   const indexOfLastMovie = currentPage * moviesPerPage;
@@ -186,6 +189,8 @@ const RecommendedMoviesPage = () => {
         </div>
       )}
       
+      <GenreFilter onGenreSelect={setSelectedGenre} selectedGenre={selectedGenre} />
+      
       {successMessage && (
         <div className="bg-green-50 p-4 rounded-lg mb-6 transition-opacity duration-300">
           <p className="text-green-700">{successMessage}</p>
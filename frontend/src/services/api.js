@@ -137,6 +137,11 @@ export const movies = {
       } else if (typeof options === 'object' && options.title_only) {
         params.title_only = true;
       }
+      
+      // Ask for per-genre, per-decade and per-rating counts of the matching movies
+      if (typeof options === 'object' && options.facets) {
+        params.facets = true;
+      }
     }
     
     // Log the search parameters for debugging
@@ -148,6 +153,11 @@ export const movies = {
   
   getGenres: () => api.get('/genres'),
   
+  // Typeahead suggestions (titles, directors and actors) from the in-memory prefix index
+  autocomplete: (query, limit = 8) => api.get('/movies/autocomplete', {
+    params: { q: query, limit }
+  }),
+  
   // Optional: Add method to get similar movies if you implement this endpoint
   getSimilar: (movieId, limit = 6) => api.get(`/movies/${movieId}/similar`, {
     params: { limit }
@@ -178,6 +188,15 @@ export const ratings = {
     return api.delete(`/ratings/${movieId}`);
   },
   
+  // Get the user's ratings for a list of movies in one request
+  getBatch: (movieIds) => 
+    api.get('/ratings/batch', {
+      params: { movie_ids: movieIds.join(',') }
+    }),
+  
+  // Add or update many ratings at once: [{ movie_id, rating, review }]
+  importRatings: (items) => api.post('/ratings/import', { ratings: items }),
+  
   getUserRatings: (page = 1, perPage = 20) => 
     api.get('/user/ratings', {
       params: { page, per_page: perPage }
@@ -224,19 +243,61 @@ export const watchlist = {
   checkMovieInWatchlist: (movieId) => {
     console.log(`Checking if movie ${movieId} is in watchlist`);
     return api.get(`/watchlist/check/${movieId}`);
+  },
+  
+  // Check which of a list of movies are in the user's watchlist in one request
+  checkMoviesInWatchlist: (movieIds) => 
+    api.get('/watchlist/check', {
+      params: { movie_ids: movieIds.join(',') }
+    })
+};
+
+// Attach the user's rating and watchlist state to a page of movies
+// using one batch request each, so movie cards don't query per movie
+export const withUserMovieState = async (movieList) => {
+  if (!movieList || movieList.length === 0) {
+    return movieList;
   }
+  
+  const movieIds = movieList.map(movie => movie.id);
+  const [ratingsResponse, watchlistResponse] = await Promise.all([
+    ratings.getBatch(movieIds),
+    watchlist.checkMoviesInWatchlist(movieIds)
+  ]);
+  
+  const userRatings = ratingsResponse.data.ratings || {};
+  const watchlistItems = watchlistResponse.data.watchlist || {};
+  
+  return movieList.map(movie => {
+    const rating = userRatings[movie.id];
+    const watchlistItem = watchlistItems[movie.id];
+    
+    return {
+      ...movie,
+      user_rating: rating ? rating.rating : null,
+      in_watchlist: Boolean(watchlistItem),
+      watchlist_id: watchlistItem ? watchlistItem.watchlist_id : null
+    };
+  });
 };
 
 // Recommendation Services
 // Recommendation Services
 export const recommendations = {
-  getRecommendations: (count = 10, refresh = false) => {
+  getRecommendations: (count = 10, refresh = false, filters = {}) => {
     console.log(`Getting recommendations with count=${count} and refresh=${refresh}`);
     
     // Create URL parameters
     const params = new URLSearchParams();
     params.append('count', count);
     
+    // Optional filters: genre, decade, year_from, year_to, min_rating, min_votes
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') {
+        params.append(key, value);
+      }
+    });
+    
     if (refresh) {
       params.append('refresh', 'true');
       // Add a random value to bust any caching